@@ -1,9 +1,14 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
+from flask.json.provider import DefaultJSONProvider
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import json
+import orjson
 import psycopg
-from psycopg.rows import dict_row
+from psycopg.rows import dict_row, scalar_row
+from psycopg_pool import ConnectionPool
 from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 import re
@@ -14,35 +19,70 @@ import datetime as dt
 from dotenv import load_dotenv
 import urllib.parse
 import logging
-from functools import wraps
+import logging.handlers
+import queue
+import atexit
+from functools import wraps, lru_cache
 import time
-import anthropic
+import threading
 import csv
 import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import stripe
 import hmac
 import hashlib
 from urllib.parse import urlparse
+from types import MappingProxyType
+from cachetools import TTLCache
 
 # Load env vars
 load_dotenv()
 
 # Configure logging
+# Request threads only enqueue records; a background listener does the
+# formatting and the file/stream writes so logging never blocks an SMS reply.
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_handlers = [
+    logging.FileHandler('chatbot.log'),
+    logging.StreamHandler()
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+
+_log_queue = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+# Forked gunicorn workers don't inherit the listener thread, so restart it there
+os.register_at_fork(after_in_child=_log_listener.start)
+atexit.register(_log_listener.stop)
+
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('chatbot.log'),
-        logging.StreamHandler()
-    ]
+    handlers=[_queue_handler]
 )
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify()/get_json() backed by orjson. Keys stay sorted and dates still go
+    through Flask's default (HTTP-date strings), so responses read as before."""
+    _options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Version tracking
 APP_VERSION = "5.2"
-CHANGELOG = {
+CHANGELOG = MappingProxyType({
     "5.2": "IMPORTANT: Updated to new phone number +18338613041 for all Hey Alex SMS communications",
     "5.1": "ENHANCED: Added comprehensive ESPN Sports API integration for NFL, MLB, NHL, and College Football with real-time data",
     "5.0": "MAJOR: Added ESPN Sports API integration for accurate NFL team schedules, scores, and game information",
@@ -53,35 +93,51 @@ CHANGELOG = {
     "3.2": "COST OPTIMIZATION: Reduced to 200 messages/month with 160-char limit for sustainable pricing ($12/month cost vs $20 revenue)",
     "3.1": "Added comprehensive admin endpoints: remove-user, reset-user, and restore-user for complete user management",
     "3.0": "MAJOR: Migrated from SQLite to PostgreSQL for persistent data storage - no more data loss on redeploys!",
-}
+})
+LATEST_CHANGES = CHANGELOG[APP_VERSION]
 
 # === Config & API Keys ===
 CLICKSEND_USERNAME = os.getenv("CLICKSEND_USERNAME")
 CLICKSEND_API_KEY = os.getenv("CLICKSEND_API_KEY")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
+BROADCAST_API_KEY = os.getenv("BROADCAST_API_KEY")
+# Compared as bytes: compare_digest rejects str with non-ASCII characters, which
+# a request header can carry
+BROADCAST_API_KEY_BYTES = BROADCAST_API_KEY.encode() if BROADCAST_API_KEY else None
 
 # PostgreSQL Database Configuration
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# Debug API key availability
-logger.info(f"🔑 API Keys Status:")
-logger.info(f"  CLICKSEND_USERNAME: {'✅ Set' if CLICKSEND_USERNAME else '❌ Missing'}")
-logger.info(f"  CLICKSEND_API_KEY: {'✅ Set' if CLICKSEND_API_KEY else '❌ Missing'}")
-logger.info(f"  ANTHROPIC_API_KEY: {'✅ Set' if ANTHROPIC_API_KEY else '❌ Missing'}")
-logger.info(f"  SERPAPI_API_KEY: {'✅ Set' if SERPAPI_API_KEY else '❌ Missing'}")
-logger.info(f"  DATABASE_URL: {'✅ Set' if DATABASE_URL else '❌ Missing'}")
+# API key availability: the full status is diagnostic (DEBUG); a missing key
+# still warns, since the matching feature is silently unavailable without it
+_API_KEYS = (
+    ("CLICKSEND_USERNAME", CLICKSEND_USERNAME),
+    ("CLICKSEND_API_KEY", CLICKSEND_API_KEY),
+    ("ANTHROPIC_API_KEY", ANTHROPIC_API_KEY),
+    ("SERPAPI_API_KEY", SERPAPI_API_KEY),
+    ("DATABASE_URL", DATABASE_URL),
+)
+if logger.isEnabledFor(logging.DEBUG):
+    logger.debug("🔑 API Keys Status:\n%s", "\n".join(
+        f"  {name}: {'✅ Set' if value else '❌ Missing'}" for name, value in _API_KEYS
+    ))
+_missing_keys = [name for name, value in _API_KEYS if not value]
+if _missing_keys:
+    logger.warning("🔑 Missing API keys: %s", ", ".join(_missing_keys))
 
 if not DATABASE_URL:
     logger.error("🚨 DATABASE_URL not found! PostgreSQL connection required.")
     raise Exception("DATABASE_URL environment variable must be set for PostgreSQL connection")
 
 # Parse DATABASE_URL to show connection info (without password)
-try:
-    parsed = urlparse(DATABASE_URL)
-    logger.info(f"🗄️ PostgreSQL: {parsed.hostname}:{parsed.port}/{parsed.path[1:]} (user: {parsed.username})")
-except Exception as e:
-    logger.error(f"Error parsing DATABASE_URL: {e}")
+if logger.isEnabledFor(logging.DEBUG):
+    try:
+        parsed = urlparse(DATABASE_URL)
+        logger.debug("🗄️ PostgreSQL: %s:%s/%s (user: %s)",
+                     parsed.hostname, parsed.port, parsed.path[1:], parsed.username)
+    except Exception as e:
+        logger.error(f"Error parsing DATABASE_URL: {e}")
 
 # Stripe Configuration
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
@@ -90,21 +146,16 @@ STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
 
 if STRIPE_SECRET_KEY:
     stripe.api_key = STRIPE_SECRET_KEY
-    logger.info("✅ Stripe API initialized successfully")
+    logger.debug("✅ Stripe API initialized successfully")
 
-# Initialize Anthropic client
-anthropic_client = None
+# Claude is called over plain HTTPS (see ask_claude), so the SDK isn't imported
 if ANTHROPIC_API_KEY:
-    try:
-        import anthropic as anthropic_lib
-        anthropic_lib.api_key = ANTHROPIC_API_KEY
-        anthropic_client = anthropic_lib
-        logger.info("✅ Anthropic client initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize Anthropic: {e}")
+    logger.debug("✅ Anthropic API key configured")
 
-WHITELIST_FILE = "whitelist.txt"
-USAGE_FILE = "usage.json"
+# The whitelist lives in the whitelist table (see init_db); add and remove numbers
+# with the admin endpoints or let Stripe subscriptions do it. This file is only
+# the one-time import source for databases created before that table existed.
+LEGACY_WHITELIST_FILE = "legacy_whitelist.txt"
 MONTHLY_LIMIT = 200
 RESET_DAYS = 30
 
@@ -112,6 +163,7 @@ RESET_DAYS = 30
 MAX_SMS_LENGTH = 480        # Standard response (3 SMS parts)
 LONGER_SMS_LENGTH = 480     # "Longer" response (same as standard now)
 CLICKSEND_MAX_LENGTH = 1600
+CLICKSEND_BATCH_SIZE = 1000   # Max messages per ClickSend send request
 
 # WELCOME MESSAGE
 WELCOME_MSG = (
@@ -139,6 +191,15 @@ ONBOARDING_COMPLETE_MSG = (
     "Remember to text +18338613041 for all questions."
 )
 
+# Onboarding replies only vary by first name, so repeat names reuse the string
+@lru_cache(maxsize=256)
+def onboarding_location_msg(name):
+    return ONBOARDING_LOCATION_MSG.format(name=name)
+
+@lru_cache(maxsize=256)
+def onboarding_complete_msg(name):
+    return ONBOARDING_COMPLETE_MSG.format(name=name)
+
 # === Intent Detection Classes ===
 @dataclass
 class IntentResult:
@@ -148,170 +209,234 @@ class IntentResult:
 
 # === ESPN Sports API Integration ===
 ESPN_BASE_URL = "https://site.web.api.espn.com/apis/site/v2/sports"
+ESPN_TIMEOUT = (3.05, 6)      # (connect, read) seconds
+
+# NFL teams
+NFL_TEAMS = {
+    'saints': {'id': '18', 'name': 'New Orleans Saints'},
+    'patriots': {'id': '17', 'name': 'New England Patriots'},
+    'cowboys': {'id': '6', 'name': 'Dallas Cowboys'},
+    'packers': {'id': '9', 'name': 'Green Bay Packers'},
+    'chiefs': {'id': '12', 'name': 'Kansas City Chiefs'},
+    'bills': {'id': '2', 'name': 'Buffalo Bills'},
+    'bengals': {'id': '4', 'name': 'Cincinnati Bengals'},
+    'ravens': {'id': '33', 'name': 'Baltimore Ravens'},
+    'steelers': {'id': '23', 'name': 'Pittsburgh Steelers'},
+    'browns': {'id': '5', 'name': 'Cleveland Browns'},
+    'titans': {'id': '10', 'name': 'Tennessee Titans'},
+    'colts': {'id': '11', 'name': 'Indianapolis Colts'},
+    'jaguars': {'id': '30', 'name': 'Jacksonville Jaguars'},
+    'texans': {'id': '34', 'name': 'Houston Texans'},
+    'broncos': {'id': '7', 'name': 'Denver Broncos',},
+    'chargers': {'id': '24', 'name': 'Los Angeles Chargers'},
+    'raiders': {'id': '13', 'name': 'Las Vegas Raiders'},
+    'dolphins': {'id': '15', 'name': 'Miami Dolphins'},
+    'jets': {'id': '20', 'name': 'New York Jets'},
+    'eagles': {'id': '21', 'name': 'Philadelphia Eagles'},
+    'commanders': {'id': '28', 'name': 'Washington Commanders'},
+    'giants': {'id': '19', 'name': 'New York Giants'},
+    'rams': {'id': '14', 'name': 'Los Angeles Rams'},
+    'seahawks': {'id': '26', 'name': 'Seattle Seahawks'},
+    '49ers': {'id': '25', 'name': 'San Francisco 49ers'},
+    'cardinals': {'id': '22', 'name': 'Arizona Cardinals'},
+    'vikings': {'id': '16', 'name': 'Minnesota Vikings'},
+    'lions': {'id': '8', 'name': 'Detroit Lions'},
+    'bears': {'id': '3', 'name': 'Chicago Bears'},
+    'buccaneers': {'id': '27', 'name': 'Tampa Bay Buccaneers'},
+    'falcons': {'id': '1', 'name': 'Atlanta Falcons'},
+    'panthers': {'id': '29', 'name': 'Carolina Panthers'}
+}
+
+# MLB teams
+MLB_TEAMS = {
+    'yankees': {'id': '10', 'name': 'New York Yankees'},
+    'red sox': {'id': '2', 'name': 'Boston Red Sox'},
+    'blue jays': {'id': '14', 'name': 'Toronto Blue Jays'},
+    'orioles': {'id': '1', 'name': 'Baltimore Orioles'},
+    'rays': {'id': '30', 'name': 'Tampa Bay Rays'},
+    'white sox': {'id': '4', 'name': 'Chicago White Sox'},
+    'guardians': {'id': '5', 'name': 'Cleveland Guardians'},
+    'tigers': {'id': '6', 'name': 'Detroit Tigers'},
+    'royals': {'id': '7', 'name': 'Kansas City Royals'},
+    'twins': {'id': '9', 'name': 'Minnesota Twins'},
+    'astros': {'id': '18', 'name': 'Houston Astros'},
+    'angels': {'id': '3', 'name': 'Los Angeles Angels'},
+    'athletics': {'id': '11', 'name': 'Oakland Athletics'},
+    'mariners': {'id': '12', 'name': 'Seattle Mariners'},
+    'rangers': {'id': '13', 'name': 'Texas Rangers'},
+    'braves': {'id': '15', 'name': 'Atlanta Braves'},
+    'marlins': {'id': '28', 'name': 'Miami Marlins'},
+    'mets': {'id': '21', 'name': 'New York Mets'},
+    'phillies': {'id': '22', 'name': 'Philadelphia Phillies'},
+    'nationals': {'id': '20', 'name': 'Washington Nationals'},
+    'cubs': {'id': '16', 'name': 'Chicago Cubs'},
+    'reds': {'id': '17', 'name': 'Cincinnati Reds'},
+    'brewers': {'id': '8', 'name': 'Milwaukee Brewers'},
+    'pirates': {'id': '23', 'name': 'Pittsburgh Pirates'},
+    'cardinals': {'id': '24', 'name': 'St. Louis Cardinals'},
+    'diamondbacks': {'id': '29', 'name': 'Arizona Diamondbacks'},
+    'rockies': {'id': '27', 'name': 'Colorado Rockies'},
+    'dodgers': {'id': '19', 'name': 'Los Angeles Dodgers'},
+    'padres': {'id': '25', 'name': 'San Diego Padres'},
+    'giants': {'id': '26', 'name': 'San Francisco Giants'}
+}
+
+# NHL teams
+NHL_TEAMS = {
+    'bruins': {'id': '6', 'name': 'Boston Bruins'},
+    'sabres': {'id': '7', 'name': 'Buffalo Sabres'},
+    'red wings': {'id': '17', 'name': 'Detroit Red Wings'},
+    'panthers': {'id': '13', 'name': 'Florida Panthers'},
+    'canadiens': {'id': '8', 'name': 'Montreal Canadiens'},
+    'senators': {'id': '9', 'name': 'Ottawa Senators'},
+    'lightning': {'id': '14', 'name': 'Tampa Bay Lightning'},
+    'maple leafs': {'id': '10', 'name': 'Toronto Maple Leafs'},
+    'hurricanes': {'id': '12', 'name': 'Carolina Hurricanes'},
+    'blue jackets': {'id': '29', 'name': 'Columbus Blue Jackets'},
+    'devils': {'id': '18', 'name': 'New Jersey Devils'},
+    'islanders': {'id': '19', 'name': 'New York Islanders'},
+    'rangers': {'id': '20', 'name': 'New York Rangers'},
+    'flyers': {'id': '4', 'name': 'Philadelphia Flyers'},
+    'penguins': {'id': '5', 'name': 'Pittsburgh Penguins'},
+    'capitals': {'id': '15', 'name': 'Washington Capitals'},
+    'blackhawks': {'id': '16', 'name': 'Chicago Blackhawks'},
+    'avalanche': {'id': '21', 'name': 'Colorado Avalanche'},
+    'stars': {'id': '25', 'name': 'Dallas Stars'},
+    'wild': {'id': '30', 'name': 'Minnesota Wild'},
+    'predators': {'id': '18', 'name': 'Nashville Predators'},
+    'blues': {'id': '19', 'name': 'St. Louis Blues'},
+    'flames': {'id': '20', 'name': 'Calgary Flames'},
+    'oilers': {'id': '22', 'name': 'Edmonton Oilers'},
+    'kraken': {'id': '26', 'name': 'Seattle Kraken'},
+    'canucks': {'id': '23', 'name': 'Vancouver Canucks'},
+    'ducks': {'id': '24', 'name': 'Anaheim Ducks'},
+    'kings': {'id': '26', 'name': 'Los Angeles Kings'},
+    'sharks': {'id': '28', 'name': 'San Jose Sharks'},
+    'golden knights': {'id': '37', 'name': 'Vegas Golden Knights'},
+    'coyotes': {'id': '53', 'name': 'Arizona Coyotes'}
+}
+
+# College teams (major ones)
+COLLEGE_TEAMS = {
+    'alabama': {'id': '333', 'name': 'Alabama Crimson Tide'},
+    'georgia': {'id': '61', 'name': 'Georgia Bulldogs'},
+    'ohio state': {'id': '194', 'name': 'Ohio State Buckeyes'},
+    'michigan': {'id': '130', 'name': 'Michigan Wolverines'},
+    'clemson': {'id': '228', 'name': 'Clemson Tigers'},
+    'notre dame': {'id': '87', 'name': 'Notre Dame Fighting Irish'},
+    'texas': {'id': '251', 'name': 'Texas Longhorns'},
+    'oklahoma': {'id': '201', 'name': 'Oklahoma Sooners'},
+    'lsu': {'id': '99', 'name': 'LSU Tigers'},
+    'florida': {'id': '57', 'name': 'Florida Gators'},
+    'penn state': {'id': '213', 'name': 'Penn State Nittany Lions'},
+    'wisconsin': {'id': '275', 'name': 'Wisconsin Badgers'},
+    'oregon': {'id': '2483', 'name': 'Oregon Ducks'},
+    'usc': {'id': '30', 'name': 'USC Trojans'},
+    'ucla': {'id': '26', 'name': 'UCLA Bruins'},
+    'stanford': {'id': '24', 'name': 'Stanford Cardinal'},
+    'miami': {'id': '2390', 'name': 'Miami Hurricanes'},
+    'florida state': {'id': '52', 'name': 'Florida State Seminoles'},
+    'virginia tech': {'id': '259', 'name': 'Virginia Tech Hokies'},
+    'north carolina': {'id': '153', 'name': 'North Carolina Tar Heels'},
+    'duke': {'id': '150', 'name': 'Duke Blue Devils'},
+    'kentucky': {'id': '96', 'name': 'Kentucky Wildcats'},
+    'tennessee': {'id': '2633', 'name': 'Tennessee Volunteers'},
+    'auburn': {'id': '2', 'name': 'Auburn Tigers'},
+    'mississippi': {'id': '145', 'name': 'Ole Miss Rebels'},
+    'mississippi state': {'id': '344', 'name': 'Mississippi State Bulldogs'},
+    'arkansas': {'id': '8', 'name': 'Arkansas Razorbacks'},
+    'missouri': {'id': '142', 'name': 'Missouri Tigers'},
+    'south carolina': {'id': '2579', 'name': 'South Carolina Gamecocks'},
+    'vanderbilt': {'id': '238', 'name': 'Vanderbilt Commodores'},
+    'texas a&m': {'id': '245', 'name': 'Texas A&M Aggies'},
+    'tulane': {'id': '2655', 'name': 'Tulane Green Wave'}
+}
+
+ESPN_TEAMS = {
+    'nfl': NFL_TEAMS,
+    'mlb': MLB_TEAMS,
+    'nhl': NHL_TEAMS,
+    'college': COLLEGE_TEAMS
+}
+
+# Space-free team keys, computed once instead of on every lookup
+_DROP_SPACES = str.maketrans('', '', ' ')
+TEAM_LOOKUP = {
+    sport: tuple((key.translate(_DROP_SPACES), info) for key, info in teams.items())
+    for sport, teams in ESPN_TEAMS.items()
+}
 
 def get_team_data(team_name, sport_type):
     """Get team data for different sports from ESPN API"""
     
-    # NFL teams
-    nfl_teams = {
-        'saints': {'id': '18', 'name': 'New Orleans Saints'},
-        'patriots': {'id': '17', 'name': 'New England Patriots'},
-        'cowboys': {'id': '6', 'name': 'Dallas Cowboys'},
-        'packers': {'id': '9', 'name': 'Green Bay Packers'},
-        'chiefs': {'id': '12', 'name': 'Kansas City Chiefs'},
-        'bills': {'id': '2', 'name': 'Buffalo Bills'},
-        'bengals': {'id': '4', 'name': 'Cincinnati Bengals'},
-        'ravens': {'id': '33', 'name': 'Baltimore Ravens'},
-        'steelers': {'id': '23', 'name': 'Pittsburgh Steelers'},
-        'browns': {'id': '5', 'name': 'Cleveland Browns'},
-        'titans': {'id': '10', 'name': 'Tennessee Titans'},
-        'colts': {'id': '11', 'name': 'Indianapolis Colts'},
-        'jaguars': {'id': '30', 'name': 'Jacksonville Jaguars'},
-        'texans': {'id': '34', 'name': 'Houston Texans'},
-        'broncos': {'id': '7', 'name': 'Denver Broncos',},
-        'chargers': {'id': '24', 'name': 'Los Angeles Chargers'},
-        'raiders': {'id': '13', 'name': 'Las Vegas Raiders'},
-        'dolphins': {'id': '15', 'name': 'Miami Dolphins'},
-        'jets': {'id': '20', 'name': 'New York Jets'},
-        'eagles': {'id': '21', 'name': 'Philadelphia Eagles'},
-        'commanders': {'id': '28', 'name': 'Washington Commanders'},
-        'giants': {'id': '19', 'name': 'New York Giants'},
-        'rams': {'id': '14', 'name': 'Los Angeles Rams'},
-        'seahawks': {'id': '26', 'name': 'Seattle Seahawks'},
-        '49ers': {'id': '25', 'name': 'San Francisco 49ers'},
-        'cardinals': {'id': '22', 'name': 'Arizona Cardinals'},
-        'vikings': {'id': '16', 'name': 'Minnesota Vikings'},
-        'lions': {'id': '8', 'name': 'Detroit Lions'},
-        'bears': {'id': '3', 'name': 'Chicago Bears'},
-        'buccaneers': {'id': '27', 'name': 'Tampa Bay Buccaneers'},
-        'falcons': {'id': '1', 'name': 'Atlanta Falcons'},
-        'panthers': {'id': '29', 'name': 'Carolina Panthers'}
-    }
-    
-    # MLB teams
-    mlb_teams = {
-        'yankees': {'id': '10', 'name': 'New York Yankees'},
-        'red sox': {'id': '2', 'name': 'Boston Red Sox'},
-        'blue jays': {'id': '14', 'name': 'Toronto Blue Jays'},
-        'orioles': {'id': '1', 'name': 'Baltimore Orioles'},
-        'rays': {'id': '30', 'name': 'Tampa Bay Rays'},
-        'white sox': {'id': '4', 'name': 'Chicago White Sox'},
-        'guardians': {'id': '5', 'name': 'Cleveland Guardians'},
-        'tigers': {'id': '6', 'name': 'Detroit Tigers'},
-        'royals': {'id': '7', 'name': 'Kansas City Royals'},
-        'twins': {'id': '9', 'name': 'Minnesota Twins'},
-        'astros': {'id': '18', 'name': 'Houston Astros'},
-        'angels': {'id': '3', 'name': 'Los Angeles Angels'},
-        'athletics': {'id': '11', 'name': 'Oakland Athletics'},
-        'mariners': {'id': '12', 'name': 'Seattle Mariners'},
-        'rangers': {'id': '13', 'name': 'Texas Rangers'},
-        'braves': {'id': '15', 'name': 'Atlanta Braves'},
-        'marlins': {'id': '28', 'name': 'Miami Marlins'},
-        'mets': {'id': '21', 'name': 'New York Mets'},
-        'phillies': {'id': '22', 'name': 'Philadelphia Phillies'},
-        'nationals': {'id': '20', 'name': 'Washington Nationals'},
-        'cubs': {'id': '16', 'name': 'Chicago Cubs'},
-        'reds': {'id': '17', 'name': 'Cincinnati Reds'},
-        'brewers': {'id': '8', 'name': 'Milwaukee Brewers'},
-        'pirates': {'id': '23', 'name': 'Pittsburgh Pirates'},
-        'cardinals': {'id': '24', 'name': 'St. Louis Cardinals'},
-        'diamondbacks': {'id': '29', 'name': 'Arizona Diamondbacks'},
-        'rockies': {'id': '27', 'name': 'Colorado Rockies'},
-        'dodgers': {'id': '19', 'name': 'Los Angeles Dodgers'},
-        'padres': {'id': '25', 'name': 'San Diego Padres'},
-        'giants': {'id': '26', 'name': 'San Francisco Giants'}
-    }
-    
-    # NHL teams
-    nhl_teams = {
-        'bruins': {'id': '6', 'name': 'Boston Bruins'},
-        'sabres': {'id': '7', 'name': 'Buffalo Sabres'},
-        'red wings': {'id': '17', 'name': 'Detroit Red Wings'},
-        'panthers': {'id': '13', 'name': 'Florida Panthers'},
-        'canadiens': {'id': '8', 'name': 'Montreal Canadiens'},
-        'senators': {'id': '9', 'name': 'Ottawa Senators'},
-        'lightning': {'id': '14', 'name': 'Tampa Bay Lightning'},
-        'maple leafs': {'id': '10', 'name': 'Toronto Maple Leafs'},
-        'hurricanes': {'id': '12', 'name': 'Carolina Hurricanes'},
-        'blue jackets': {'id': '29', 'name': 'Columbus Blue Jackets'},
-        'devils': {'id': '18', 'name': 'New Jersey Devils'},
-        'islanders': {'id': '19', 'name': 'New York Islanders'},
-        'rangers': {'id': '20', 'name': 'New York Rangers'},
-        'flyers': {'id': '4', 'name': 'Philadelphia Flyers'},
-        'penguins': {'id': '5', 'name': 'Pittsburgh Penguins'},
-        'capitals': {'id': '15', 'name': 'Washington Capitals'},
-        'blackhawks': {'id': '16', 'name': 'Chicago Blackhawks'},
-        'avalanche': {'id': '21', 'name': 'Colorado Avalanche'},
-        'stars': {'id': '25', 'name': 'Dallas Stars'},
-        'wild': {'id': '30', 'name': 'Minnesota Wild'},
-        'predators': {'id': '18', 'name': 'Nashville Predators'},
-        'blues': {'id': '19', 'name': 'St. Louis Blues'},
-        'flames': {'id': '20', 'name': 'Calgary Flames'},
-        'oilers': {'id': '22', 'name': 'Edmonton Oilers'},
-        'kraken': {'id': '26', 'name': 'Seattle Kraken'},
-        'canucks': {'id': '23', 'name': 'Vancouver Canucks'},
-        'ducks': {'id': '24', 'name': 'Anaheim Ducks'},
-        'kings': {'id': '26', 'name': 'Los Angeles Kings'},
-        'sharks': {'id': '28', 'name': 'San Jose Sharks'},
-        'golden knights': {'id': '37', 'name': 'Vegas Golden Knights'},
-        'coyotes': {'id': '53', 'name': 'Arizona Coyotes'}
-    }
-    
-    # College teams (major ones)
-    college_teams = {
-        'alabama': {'id': '333', 'name': 'Alabama Crimson Tide'},
-        'georgia': {'id': '61', 'name': 'Georgia Bulldogs'},
-        'ohio state': {'id': '194', 'name': 'Ohio State Buckeyes'},
-        'michigan': {'id': '130', 'name': 'Michigan Wolverines'},
-        'clemson': {'id': '228', 'name': 'Clemson Tigers'},
-        'notre dame': {'id': '87', 'name': 'Notre Dame Fighting Irish'},
-        'texas': {'id': '251', 'name': 'Texas Longhorns'},
-        'oklahoma': {'id': '201', 'name': 'Oklahoma Sooners'},
-        'lsu': {'id': '99', 'name': 'LSU Tigers'},
-        'florida': {'id': '57', 'name': 'Florida Gators'},
-        'penn state': {'id': '213', 'name': 'Penn State Nittany Lions'},
-        'wisconsin': {'id': '275', 'name': 'Wisconsin Badgers'},
-        'oregon': {'id': '2483', 'name': 'Oregon Ducks'},
-        'usc': {'id': '30', 'name': 'USC Trojans'},
-        'ucla': {'id': '26', 'name': 'UCLA Bruins'},
-        'stanford': {'id': '24', 'name': 'Stanford Cardinal'},
-        'miami': {'id': '2390', 'name': 'Miami Hurricanes'},
-        'florida state': {'id': '52', 'name': 'Florida State Seminoles'},
-        'virginia tech': {'id': '259', 'name': 'Virginia Tech Hokies'},
-        'north carolina': {'id': '153', 'name': 'North Carolina Tar Heels'},
-        'duke': {'id': '150', 'name': 'Duke Blue Devils'},
-        'kentucky': {'id': '96', 'name': 'Kentucky Wildcats'},
-        'tennessee': {'id': '2633', 'name': 'Tennessee Volunteers'},
-        'auburn': {'id': '2', 'name': 'Auburn Tigers'},
-        'mississippi': {'id': '145', 'name': 'Ole Miss Rebels'},
-        'mississippi state': {'id': '344', 'name': 'Mississippi State Bulldogs'},
-        'arkansas': {'id': '8', 'name': 'Arkansas Razorbacks'},
-        'missouri': {'id': '142', 'name': 'Missouri Tigers'},
-        'south carolina': {'id': '2579', 'name': 'South Carolina Gamecocks'},
-        'vanderbilt': {'id': '238', 'name': 'Vanderbilt Commodores'},
-        'texas a&m': {'id': '245', 'name': 'Texas A&M Aggies'},
-        'tulane': {'id': '2655', 'name': 'Tulane Green Wave'}
-    }
-    
-    teams = {
-        'nfl': nfl_teams,
-        'mlb': mlb_teams, 
-        'nhl': nhl_teams,
-        'college': college_teams
-    }
-    
-    if sport_type not in teams:
+    if sport_type not in TEAM_LOOKUP:
         return None
         
-    team_key = team_name.lower().replace(' ', '').replace('new orleans', 'saints').replace('neworleans', 'saints')
+    team_key = team_name.lower().translate(_DROP_SPACES).replace('neworleans', 'saints')
     
     # Find team by partial match
-    for key, team_info in teams[sport_type].items():
-        if key.replace(' ', '') in team_key or team_key in key.replace(' ', ''):
+    for key, team_info in TEAM_LOOKUP[sport_type]:
+        if key in team_key or team_key in key:
             return team_info
     
     return None
 
+def parse_game_date(date_str):
+    """Parse ESPN date format with flexible handling"""
+    try:
+        # Try with seconds first
+        dt = datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%SZ')
+        return dt.replace(tzinfo=timezone.utc)
+    except ValueError:
+        try:
+            # Try without seconds
+            dt = datetime.strptime(date_str, '%Y-%m-%dT%H:%MZ')
+            return dt.replace(tzinfo=timezone.utc)
+        except ValueError:
+            try:
+                # Try ISO format
+                return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+            except ValueError:
+                logger.error(f"Unable to parse date: {date_str}")
+                return None
+
+def convert_to_central(utc_dt):
+    """Convert UTC datetime to Central Time"""
+    # Central Time is UTC-6 (CST) or UTC-5 (CDT)
+    # Since it's August, we're in CDT (UTC-5)
+    central_offset = timedelta(hours=-5)  # CDT offset
+    return utc_dt + central_offset
+
+# Parsed ESPN payloads keyed on URL. Fans ask about the same game in bursts;
+# a minute is fresh enough for scores over SMS. Only 200 responses are cached.
+_espn_cache = TTLCache(maxsize=256, ttl=60)
+_espn_lock = threading.Lock()
+
+# Keep-alive session for the ESPN API; these are idempotent GETs, so a
+# connection error or 502-504 is retried once by the adapter
+espn_session = requests.Session()
+espn_session.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=1, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+))
+
+def fetch_espn_json(url):
+    """GET an ESPN endpoint; returns the parsed JSON, or None on a non-200 response"""
+    with _espn_lock:
+        data = _espn_cache.get(url)
+    if data is not None:
+        return data
+    
+    response = espn_session.get(url, timeout=ESPN_TIMEOUT)
+    if response.status_code != 200:
+        return None
+    
+    data = orjson.loads(response.content)
+    with _espn_lock:
+        _espn_cache[url] = data
+    return data
+
 def get_sports_schedule(sport, team_id=None, team_name=""):
     """Get sports schedule from ESPN API"""
     try:
@@ -326,52 +451,20 @@ def get_sports_schedule(sport, team_id=None, team_name=""):
         if sport not in sport_urls:
             return f"Sport '{sport}' not supported yet."
         
-        url = sport_urls[sport]
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code != 200:
+        data = fetch_espn_json(sport_urls[sport])
+        if data is None:
             return f"Unable to get {team_name} schedule right now."
         
-        data = response.json()
-        
         if 'events' not in data:
             return f"No {team_name} games found."
         
         events = data['events']
         today = datetime.now().date()
         
-        # Look for today's game
+        # Look for today's game; keep each pick's parsed kickoff so it isn't re-parsed below
         todays_game = None
         next_game = None
         
-        def parse_game_date(date_str):
-            """Parse ESPN date format with flexible handling"""
-            try:
-                # Try with seconds first
-                dt = datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%SZ')
-                return dt.replace(tzinfo=timezone.utc)
-            except ValueError:
-                try:
-                    # Try without seconds
-                    dt = datetime.strptime(date_str, '%Y-%m-%dT%H:%MZ')
-                    return dt.replace(tzinfo=timezone.utc)
-                except ValueError:
-                    try:
-                        # Try ISO format
-                        return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-                    except ValueError:
-                        logger.error(f"Unable to parse date: {date_str}")
-                        return None
-        
-        def convert_to_central(utc_dt):
-            """Convert UTC datetime to Central Time"""
-            if not utc_dt:
-                return None
-            # Central Time is UTC-6 (CST) or UTC-5 (CDT)
-            # Since it's August, we're in CDT (UTC-5)
-            central_offset = timedelta(hours=-5)  # CDT offset
-            return utc_dt + central_offset
-        
         for event in events:
             game_datetime_utc = parse_game_date(event['date'])
             if not game_datetime_utc:
@@ -379,16 +472,13 @@ def get_sports_schedule(sport, team_id=None, team_name=""):
                 
             # Convert to Central Time for date comparison
             game_datetime_central = convert_to_central(game_datetime_utc)
-            if not game_datetime_central:
-                continue
-                
             game_date = game_datetime_central.date()
             
             if game_date == today:
-                todays_game = event
+                todays_game = (event, game_datetime_central)
                 break
             elif game_date > today and not next_game:
-                next_game = event
+                next_game = (event, game_datetime_central)
         
         # Get team record if available
         record = ""
@@ -399,46 +489,37 @@ def get_sports_schedule(sport, team_id=None, team_name=""):
         
         # Format response
         if todays_game:
+            event, game_datetime_central = todays_game
             opponent = ""
             game_time = ""
             
-            for competition in todays_game.get('competitions', []):
+            for competition in event.get('competitions', []):
                 for competitor in competition.get('competitors', []):
                     if competitor['team']['id'] != str(team_id):
                         opponent = competitor['team']['displayName']
                 
-                game_datetime_utc = parse_game_date(todays_game['date'])
-                if game_datetime_utc:
-                    # Convert to Central Time and format
-                    game_datetime_central = convert_to_central(game_datetime_utc)
-                    if game_datetime_central:
-                        game_time = game_datetime_central.strftime('%I:%M%p CT').replace(' CT', 'PM CT' if game_datetime_central.hour >= 12 else 'AM CT')
-                        # Clean up the format
-                        game_time = game_datetime_central.strftime('%I:%M%p CT')
+                game_time = game_datetime_central.strftime('%I:%M%p CT')
             
             # Add preseason context if it's preseason
             season_type = ""
-            if todays_game.get('season', {}).get('type') == 1:  # Preseason
+            if event.get('season', {}).get('type') == 1:  # Preseason
                 season_type = " (Preseason)"
             
             return f"Yes! {team_name} play {opponent} today at {game_time}.{season_type}{record}"
         
         elif next_game:
+            event, game_datetime_central = next_game
             opponent = ""
             game_date = ""
             game_time = ""
             
-            for competition in next_game.get('competitions', []):
+            for competition in event.get('competitions', []):
                 for competitor in competition.get('competitors', []):
                     if competitor['team']['id'] != str(team_id):
                         opponent = competitor['team']['displayName']
                 
-                game_datetime_utc = parse_game_date(next_game['date'])
-                if game_datetime_utc:
-                    game_datetime_central = convert_to_central(game_datetime_utc)
-                    if game_datetime_central:
-                        game_date = game_datetime_central.strftime('%A, %B %d')
-                        game_time = game_datetime_central.strftime('%I:%M%p CT')
+                game_date = game_datetime_central.strftime('%A, %B %d')
+                game_time = game_datetime_central.strftime('%I:%M%p CT')
             
             return f"No {team_name} game today. Next: vs {opponent} on {game_date} at {game_time}.{record}"
         
@@ -463,14 +544,10 @@ def get_sports_scores(sport):
         if sport not in scoreboard_urls:
             return f"{sport.upper()} scores not available."
         
-        url = scoreboard_urls[sport]
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code != 200:
+        data = fetch_espn_json(scoreboard_urls[sport])
+        if data is None:
             return f"Unable to get {sport.upper()} scores right now."
         
-        data = response.json()
-        
         if not data.get('events'):
             return f"No {sport.upper()} games today."
         
@@ -498,10 +575,8 @@ def get_sports_scores(sport):
         logger.error(f"ESPN {sport} scores error: {e}")
         return f"Unable to get {sport.upper()} scores. Please try again."
 
-def detect_sport_type(text):
-    """Detect which sport the user is asking about"""
-    text_lower = text.lower()
-    
+def detect_sport_type(text_lower):
+    """Detect which sport the user is asking about (expects lowercased text)"""
     # Sport-specific keywords
     if any(word in text_lower for word in ['nfl', 'football', 'touchdown', 'quarterback', 'superbowl']):
         return 'nfl'
@@ -515,58 +590,64 @@ def detect_sport_type(text):
     # Default to NFL if no specific sport detected but has sports context
     return 'nfl'
 
+# All team names from all sports
+ALL_TEAMS = [
+    # NFL
+    'saints', 'patriots', 'cowboys', 'packers', 'chiefs', 'bills', 'bengals',
+    'ravens', 'steelers', 'browns', 'titans', 'colts', 'jaguars', 'texans',
+    'broncos', 'chargers', 'raiders', 'dolphins', 'jets', 'eagles',
+    'commanders', 'giants', 'rams', 'seahawks', '49ers', 'cardinals',
+    'vikings', 'lions', 'bears', 'buccaneers', 'falcons', 'panthers',
+    # MLB
+    'yankees', 'red sox', 'blue jays', 'orioles', 'rays', 'white sox',
+    'guardians', 'tigers', 'royals', 'twins', 'astros', 'angels',
+    'athletics', 'mariners', 'rangers', 'braves', 'marlins', 'mets',
+    'phillies', 'nationals', 'cubs', 'reds', 'brewers', 'pirates',
+    'cardinals', 'diamondbacks', 'rockies', 'dodgers', 'padres', 'giants',
+    # NHL
+    'bruins', 'sabres', 'red wings', 'panthers', 'canadiens', 'senators',
+    'lightning', 'maple leafs', 'hurricanes', 'blue jackets', 'devils',
+    'islanders', 'rangers', 'flyers', 'penguins', 'capitals', 'blackhawks',
+    'avalanche', 'stars', 'wild', 'predators', 'blues', 'flames',
+    'oilers', 'kraken', 'canucks', 'ducks', 'kings', 'sharks',
+    'golden knights', 'coyotes',
+    # College
+    'alabama', 'georgia', 'ohio state', 'michigan', 'clemson', 'notre dame',
+    'texas', 'oklahoma', 'lsu', 'florida', 'penn state', 'wisconsin',
+    'oregon', 'usc', 'ucla', 'stanford', 'miami', 'florida state',
+    'tulane'
+]
+
+# Sports keywords
+SPORTS_KEYWORDS = [
+    'game', 'score', 'scores', 'nfl', 'mlb', 'nhl', 'college', 'football', 
+    'baseball', 'hockey', 'schedule', 'play', 'team', 'season', 'record', 
+    'win', 'loss', 'touchdown', 'home run', 'goal', 'ncaa'
+]
+
+# Substring alternations (no word boundaries) matching the `in` checks below
+TEAM_PATTERN = re.compile('|'.join(map(re.escape, ALL_TEAMS)))
+SPORTS_KEYWORD_PATTERN = re.compile('|'.join(map(re.escape, SPORTS_KEYWORDS)))
+
 def detect_sports_intent(text: str) -> Optional[IntentResult]:
     """Enhanced sports intent detection for multiple sports"""
     text_lower = text.lower()
     
-    # All team names from all sports
-    all_teams = [
-        # NFL
-        'saints', 'patriots', 'cowboys', 'packers', 'chiefs', 'bills', 'bengals',
-        'ravens', 'steelers', 'browns', 'titans', 'colts', 'jaguars', 'texans',
-        'broncos', 'chargers', 'raiders', 'dolphins', 'jets', 'eagles',
-        'commanders', 'giants', 'rams', 'seahawks', '49ers', 'cardinals',
-        'vikings', 'lions', 'bears', 'buccaneers', 'falcons', 'panthers',
-        # MLB
-        'yankees', 'red sox', 'blue jays', 'orioles', 'rays', 'white sox',
-        'guardians', 'tigers', 'royals', 'twins', 'astros', 'angels',
-        'athletics', 'mariners', 'rangers', 'braves', 'marlins', 'mets',
-        'phillies', 'nationals', 'cubs', 'reds', 'brewers', 'pirates',
-        'cardinals', 'diamondbacks', 'rockies', 'dodgers', 'padres', 'giants',
-        # NHL
-        'bruins', 'sabres', 'red wings', 'panthers', 'canadiens', 'senators',
-        'lightning', 'maple leafs', 'hurricanes', 'blue jackets', 'devils',
-        'islanders', 'rangers', 'flyers', 'penguins', 'capitals', 'blackhawks',
-        'avalanche', 'stars', 'wild', 'predators', 'blues', 'flames',
-        'oilers', 'kraken', 'canucks', 'ducks', 'kings', 'sharks',
-        'golden knights', 'coyotes',
-        # College
-        'alabama', 'georgia', 'ohio state', 'michigan', 'clemson', 'notre dame',
-        'texas', 'oklahoma', 'lsu', 'florida', 'penn state', 'wisconsin',
-        'oregon', 'usc', 'ucla', 'stanford', 'miami', 'florida state',
-        'tulane'
-    ]
-    
-    # Sports keywords
-    sports_keywords = [
-        'game', 'score', 'scores', 'nfl', 'mlb', 'nhl', 'college', 'football', 
-        'baseball', 'hockey', 'schedule', 'play', 'team', 'season', 'record', 
-        'win', 'loss', 'touchdown', 'home run', 'goal', 'ncaa'
-    ]
-    
-    # Check for team mentions
+    # Check for team mentions; the prefilter rules out most messages in one
+    # scan, the ordered loop keeps list priority when several teams match
     mentioned_team = None
-    for team in all_teams:
-        if team in text_lower:
-            mentioned_team = team
-            break
+    if TEAM_PATTERN.search(text_lower):
+        for team in ALL_TEAMS:
+            if team in text_lower:
+                mentioned_team = team
+                break
     
     # Check for sports context
-    has_sports_context = any(keyword in text_lower for keyword in sports_keywords)
+    has_sports_context = SPORTS_KEYWORD_PATTERN.search(text_lower) is not None
     
     if mentioned_team or has_sports_context:
         # Determine sport type
-        sport_type = detect_sport_type(text)
+        sport_type = detect_sport_type(text_lower)
         
         # Determine query type
         if any(word in text_lower for word in ['today', 'tonight', 'game today']):
@@ -595,29 +676,248 @@ def handle_errors(f):
     return decorated_function
 
 # === PostgreSQL Connection Manager ===
+# Session settings applied on every new connection: fail fast instead of hanging a
+# webhook on an unreachable server, a held row lock or a runaway query
+DB_CONNECT_KWARGS = {
+    "row_factory": dict_row,
+    # Statements commit on their own; multi-statement writes open an explicit
+    # transaction, so reads never leave an implicit BEGIN pending
+    "autocommit": True,
+    # Pooled connections live across requests and the hot-path SQL is
+    # static, so prepare a statement on its second run rather than the sixth
+    "prepare_threshold": 1,
+    "connect_timeout": 5,
+    # TCP keepalives hold long-lived pooled connections open through idle
+    # periods and let the driver notice a dropped one instead of hanging on it
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+    "options": "-c lock_timeout=5000 -c statement_timeout=15000 -c idle_in_transaction_session_timeout=60000",
+}
+
+DB_POOL_MIN_SIZE = 1
+DB_POOL_MAX_SIZE = 10
+# How long a caller waits for a free pooled connection before giving up
+DB_POOL_TIMEOUT = 5
+
+# One pool per process, created on first use so importing the app opens no
+# connections; the single gunicorn worker (Procfile, render.yaml, no --preload)
+# opens its own on its first request. The after-fork reset below keeps a forked
+# child from reusing a parent's pool should the app ever be preloaded
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_db_pool():
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = ConnectionPool(
+                    DATABASE_URL,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    kwargs=DB_CONNECT_KWARGS,
+                    name="hey-alex",
+                    open=True,
+                )
+    return _db_pool
+
+def _reset_db_pool():
+    global _db_pool, _db_pool_lock
+    _db_pool = None
+    _db_pool_lock = threading.Lock()
+
+def _close_db_pool():
+    if _db_pool is not None:
+        _db_pool.close()
+
+os.register_at_fork(after_in_child=_reset_db_pool)
+atexit.register(_close_db_pool)
+
+# The connection each thread currently holds, so nested uses share it
+_db_local = threading.local()
+
 @contextmanager
 def get_db_connection():
-    """Context manager for PostgreSQL connections"""
-    conn = None
-    try:
-        conn = psycopg.connect(DATABASE_URL, row_factory=dict_row)
+    """Context manager for PostgreSQL connections.
+    
+    Connections are borrowed from the process pool and returned when the
+    outermost use ends; nested uses on the same thread share the outer
+    connection, so helpers called inside a transaction take part in it. The
+    pool rolls back any transaction still open on return and replaces broken
+    connections.
+    """
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None:
         yield conn
+        return
+    
+    try:
+        with get_db_pool().connection() as conn:
+            _db_local.conn = conn
+            try:
+                yield conn
+            finally:
+                _db_local.conn = None
     except Exception as e:
-        if conn:
-            conn.rollback()
         logger.error(f"Database connection error: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
+
+# === Background DB Log Writer ===
+# Assistant messages and the delivery, analytics and onboarding logs are
+# append-only, so request threads enqueue them and one writer thread inserts
+# them in batches, keeping those inserts (and the ClickSend JSON encoding) off
+# the reply path. Queued rows can lag a moment behind the request; a user's
+# message is read back by load_history on the same request, so save_message
+# writes those directly.
+DB_LOG_BATCH_SIZE = 200
+
+_DB_LOG_INSERTS = {
+    'message': """
+        INSERT INTO messages (phone, role, content, intent_type, response_time_ms)
+        VALUES (%s, %s, %s, %s, %s)
+    """,
+    'sms_delivery': """
+        INSERT INTO sms_delivery_log (phone, message_content, clicksend_response, delivery_status, message_id)
+        VALUES (%s, %s, %s, %s, %s)
+    """,
+    'usage_analytics': """
+        INSERT INTO usage_analytics (phone, intent_type, success, response_time_ms)
+        VALUES (%s, %s, %s, %s)
+    """,
+    'onboarding_step': """
+        INSERT INTO onboarding_log (phone, step, response)
+        VALUES (%s, %s, %s)
+    """,
+}
+
+_db_log_queue = queue.Queue()
+_DB_LOG_STOP = object()
+
+def enqueue_db_log(kind, params):
+    _db_log_queue.put((kind, params))
+
+DB_LOG_FLUSH_TIMEOUT = 10  # seconds; covers a full retry cycle of one batch
+
+def flush_db_logs():
+    """Block until every row queued so far is written. Admin deletes call this
+    first, so a queued reply can't land after the delete and bring data back."""
+    flushed = threading.Event()
+    _db_log_queue.put(flushed)
+    if not flushed.wait(DB_LOG_FLUSH_TIMEOUT):
+        logger.warning(f"⚠️ Log writer didn't flush within {DB_LOG_FLUSH_TIMEOUT}s")
+
+# Waits before re-sending a failed batch; after the last, rows are tried one by one
+DB_LOG_RETRY_DELAYS = (0.5, 2)
+
+def _write_db_logs(rows_by_kind):
+    row_count = sum(map(len, rows_by_kind.values()))
+    for attempt, delay in enumerate((*DB_LOG_RETRY_DELAYS, None), start=1):
+        try:
+            with get_db_connection() as conn, conn.transaction(), conn.cursor() as c:
+                for kind, rows in rows_by_kind.items():
+                    c.executemany(_DB_LOG_INSERTS[kind], rows)
+            return
+        except Exception as e:
+            logger.warning(f"⚠️ Writing {row_count} log rows failed (attempt {attempt}): {e}")
+            if delay is not None:
+                time.sleep(delay)
+    
+    _write_db_log_rows(rows_by_kind)
+
+def _write_db_log_rows(rows_by_kind):
+    """Insert rows one at a time, each under its own savepoint, so a bad row is
+    dropped on its own instead of taking the rest of the batch with it"""
+    written = 0
+    try:
+        with get_db_connection() as conn, conn.transaction(), conn.cursor() as c:
+            for kind, rows in rows_by_kind.items():
+                for row in rows:
+                    try:
+                        with conn.transaction():
+                            c.execute(_DB_LOG_INSERTS[kind], row)
+                        written += 1
+                    except psycopg.Error as e:
+                        if conn.broken:
+                            raise
+                        logger.error(f"❌ Dropping {kind} log row for {row[0]}: {e}")
+    except Exception as e:
+        logger.error(f"❌ Error writing log rows one by one: {e}")
+        written = 0
+    
+    dropped = sum(map(len, rows_by_kind.values())) - written
+    if dropped:
+        logger.error(f"❌ Dropped {dropped} log rows")
+
+def _db_log_writer():
+    while True:
+        # Block for the first entry, then take whatever else is already waiting
+        batch = [_db_log_queue.get()]
+        while len(batch) < DB_LOG_BATCH_SIZE:
+            try:
+                batch.append(_db_log_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        rows_by_kind = {}
+        flushes = []
+        stop = False
+        for entry in batch:
+            if entry is _DB_LOG_STOP:
+                stop = True
+                continue
+            if isinstance(entry, threading.Event):
+                flushes.append(entry)
+                continue
+            kind, params = entry
+            if kind == 'sms_delivery':
+                phone, message_content, clicksend_response, delivery_status, message_id = params
+                params = (phone, message_content, json.dumps(clicksend_response), delivery_status, message_id)
+            rows_by_kind.setdefault(kind, []).append(params)
+        
+        if rows_by_kind:
+            _write_db_logs(rows_by_kind)
+        for flushed in flushes:
+            flushed.set()
+        if stop:
+            return
+
+def _start_db_log_writer():
+    global _db_log_queue, _db_log_thread
+    _db_log_queue = queue.Queue()
+    _db_log_thread = threading.Thread(target=_db_log_writer, name="db-log-writer", daemon=True)
+    _db_log_thread.start()
+
+def _stop_db_log_writer():
+    """Flush pending log rows on shutdown"""
+    _db_log_queue.put(_DB_LOG_STOP)
+    _db_log_thread.join(timeout=5)
+
+_start_db_log_writer()
+# Forked gunicorn workers don't inherit the writer thread; give each its own
+os.register_at_fork(after_in_child=_start_db_log_writer)
+atexit.register(_stop_db_log_writer)
 
 # === Helper Functions ===
+class _DigitsOnlyTable(dict):
+    """str.translate table that keeps decimal digits and drops everything else.
+    Each code point is classified on first sight and cached in the dict."""
+    def __missing__(self, codepoint):
+        mapped = codepoint if chr(codepoint).isdecimal() else None
+        self[codepoint] = mapped
+        return mapped
+
+_DIGITS_ONLY = _DigitsOnlyTable()
+
+@lru_cache(maxsize=4096)
 def normalize_phone_number(phone):
     """Normalize phone number to consistent format"""
     if not phone:
         return None
     
-    digits_only = re.sub(r'\D', '', phone)
+    digits_only = phone.translate(_DIGITS_ONLY)
     
     if len(digits_only) == 10:
         digits_only = '1' + digits_only
@@ -655,170 +955,262 @@ def truncate_response(response_msg, max_length=MAX_SMS_LENGTH):
             return truncated + "..."
 
 # === Database Initialization ===
+DB_INIT_LOCK_ID = 5_182_024  # pg advisory lock key so only one worker runs the DDL at a time
+
+# Every statement is idempotent. Sent as one multi-statement script (no
+# parameters, so psycopg uses the simple query protocol) instead of one round
+# trip per table and index.
+#
+# The append-only audit logs are UNLOGGED: their writes skip the WAL, at the
+# cost of being emptied after a server crash and not reaching replicas. User
+# data, message history and Stripe records stay logged. CREATE ... IF NOT
+# EXISTS leaves an existing table as it is; converting one is a table rewrite
+# (ALTER TABLE ... SET UNLOGGED), so it isn't done here at boot.
+SCHEMA_DDL = """
+CREATE TABLE IF NOT EXISTS messages (
+    id SERIAL PRIMARY KEY,
+    phone VARCHAR(20) NOT NULL,
+    role VARCHAR(20) NOT NULL CHECK(role IN ('user','assistant')),
+    content TEXT NOT NULL,
+    ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    intent_type VARCHAR(50),
+    response_time_ms INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_messages_phone_ts
+ON messages(phone, ts DESC);
+
+-- History reads are "WHERE phone = ? ORDER BY id DESC LIMIT n"; this
+-- index serves them in order so the scan stops after n rows
+CREATE INDEX IF NOT EXISTS idx_messages_phone_id
+ON messages(phone, id DESC);
+
+CREATE TABLE IF NOT EXISTS user_profiles (
+    id SERIAL PRIMARY KEY,
+    phone VARCHAR(20) UNIQUE NOT NULL,
+    first_name VARCHAR(100),
+    location VARCHAR(200),
+    onboarding_step INTEGER DEFAULT 0,
+    onboarding_completed BOOLEAN DEFAULT FALSE,
+    stripe_customer_id VARCHAR(100),
+    subscription_status VARCHAR(50),
+    subscription_id VARCHAR(100),
+    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- phone is UNIQUE (already indexed); cancellations look users up by customer
+CREATE INDEX IF NOT EXISTS idx_user_profiles_stripe_customer
+ON user_profiles(stripe_customer_id);
+
+-- The live whitelist; replaced whitelist.txt (now legacy_whitelist.txt, imported
+-- once by migrate_legacy_whitelist), which didn't survive redeploys
+CREATE TABLE IF NOT EXISTS whitelist (
+    id SERIAL PRIMARY KEY,
+    phone VARCHAR(20) UNIQUE NOT NULL,
+    is_active BOOLEAN DEFAULT TRUE,
+    added_by VARCHAR(50) DEFAULT 'manual',
+    added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS onboarding_log (
+    id SERIAL PRIMARY KEY,
+    phone VARCHAR(20) NOT NULL,
+    step INTEGER NOT NULL,
+    response TEXT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS whitelist_events (
+    id SERIAL PRIMARY KEY,
+    phone VARCHAR(20) NOT NULL,
+    action VARCHAR(20) NOT NULL CHECK(action IN ('added','removed')),
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    source VARCHAR(50) DEFAULT 'manual'
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS sms_delivery_log (
+    id SERIAL PRIMARY KEY,
+    phone VARCHAR(20) NOT NULL,
+    message_content TEXT NOT NULL,
+    clicksend_response TEXT,
+    delivery_status VARCHAR(50),
+    message_id VARCHAR(100),
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One row per SMS sent; check-user reads a number's latest few
+CREATE INDEX IF NOT EXISTS idx_sms_delivery_log_phone_id
+ON sms_delivery_log(phone, id DESC);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS usage_analytics (
+    id SERIAL PRIMARY KEY,
+    phone VARCHAR(20) NOT NULL,
+    intent_type VARCHAR(50),
+    success BOOLEAN,
+    response_time_ms INTEGER,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS monthly_sms_usage (
+    id SERIAL PRIMARY KEY,
+    phone VARCHAR(20) NOT NULL,
+    message_count INTEGER DEFAULT 1,
+    period_start DATE NOT NULL,
+    period_end DATE NOT NULL,
+    last_message_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    quota_warnings_sent INTEGER DEFAULT 0,
+    quota_exceeded BOOLEAN DEFAULT FALSE,
+    UNIQUE(phone, period_start)
+);
+
+CREATE TABLE IF NOT EXISTS subscription_events (
+    id SERIAL PRIMARY KEY,
+    event_type VARCHAR(100) NOT NULL,
+    stripe_customer_id VARCHAR(100),
+    subscription_id VARCHAR(100),
+    phone VARCHAR(20),
+    status VARCHAR(50),
+    event_data TEXT,
+    processed BOOLEAN DEFAULT TRUE,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_subscription_events_phone_id
+ON subscription_events(phone, id DESC);
+
+-- One-time data migrations already applied
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    name VARCHAR(100) PRIMARY KEY,
+    applied_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Stripe event ids already received, so redeliveries of the same event are
+-- acknowledged without being processed twice
+CREATE TABLE IF NOT EXISTS stripe_webhook_events (
+    event_id VARCHAR(255) PRIMARY KEY,
+    event_type VARCHAR(100) NOT NULL,
+    received_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
 def init_db():
     try:
         logger.info(f"🗄️ Initializing PostgreSQL database")
         
         with get_db_connection() as conn:
-            with conn.cursor() as c:
+            with conn.transaction(), conn.cursor() as c:
                 
-                # Check existing tables
-                c.execute("""
-                    SELECT table_name FROM information_schema.tables 
-                    WHERE table_schema = 'public'
-                """)
-                existing_tables = [row['table_name'] for row in c.fetchall()]
-                logger.info(f"📊 Existing tables: {existing_tables}")
-                
-                # Messages table
-                c.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id SERIAL PRIMARY KEY,
-                    phone VARCHAR(20) NOT NULL,
-                    role VARCHAR(20) NOT NULL CHECK(role IN ('user','assistant')),
-                    content TEXT NOT NULL,
-                    ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    intent_type VARCHAR(50),
-                    response_time_ms INTEGER
-                );
-                """)
-                
-                c.execute("""
-                CREATE INDEX IF NOT EXISTS idx_messages_phone_ts 
-                ON messages(phone, ts DESC);
-                """)
-                
-                # User profiles table
-                c.execute("""
-                CREATE TABLE IF NOT EXISTS user_profiles (
-                    id SERIAL PRIMARY KEY,
-                    phone VARCHAR(20) UNIQUE NOT NULL,
-                    first_name VARCHAR(100),
-                    location VARCHAR(200),
-                    onboarding_step INTEGER DEFAULT 0,
-                    onboarding_completed BOOLEAN DEFAULT FALSE,
-                    stripe_customer_id VARCHAR(100),
-                    subscription_status VARCHAR(50),
-                    subscription_id VARCHAR(100),
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                """)
+                # Serialize schema setup across workers; released on commit. Waiting
+                # on another worker's setup can outlast the default lock_timeout.
+                c.execute("SET LOCAL lock_timeout = '60s'")
+                c.execute("SELECT pg_advisory_xact_lock(%s)", (DB_INIT_LOCK_ID,))
                 
-                # Other tables
-                c.execute("""
-                CREATE TABLE IF NOT EXISTS onboarding_log (
-                    id SERIAL PRIMARY KEY,
-                    phone VARCHAR(20) NOT NULL,
-                    step INTEGER NOT NULL,
-                    response TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                """)
-                
-                c.execute("""
-                CREATE TABLE IF NOT EXISTS whitelist_events (
-                    id SERIAL PRIMARY KEY,
-                    phone VARCHAR(20) NOT NULL,
-                    action VARCHAR(20) NOT NULL CHECK(action IN ('added','removed')),
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    source VARCHAR(50) DEFAULT 'manual'
-                );
-                """)
-                
-                c.execute("""
-                CREATE TABLE IF NOT EXISTS sms_delivery_log (
-                    id SERIAL PRIMARY KEY,
-                    phone VARCHAR(20) NOT NULL,
-                    message_content TEXT NOT NULL,
-                    clicksend_response TEXT,
-                    delivery_status VARCHAR(50),
-                    message_id VARCHAR(100),
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                """)
-                
-                c.execute("""
-                CREATE TABLE IF NOT EXISTS usage_analytics (
-                    id SERIAL PRIMARY KEY,
-                    phone VARCHAR(20) NOT NULL,
-                    intent_type VARCHAR(50),
-                    success BOOLEAN,
-                    response_time_ms INTEGER,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                """)
-                
-                c.execute("""
-                CREATE TABLE IF NOT EXISTS monthly_sms_usage (
-                    id SERIAL PRIMARY KEY,
-                    phone VARCHAR(20) NOT NULL,
-                    message_count INTEGER DEFAULT 1,
-                    period_start DATE NOT NULL,
-                    period_end DATE NOT NULL,
-                    last_message_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    quota_warnings_sent INTEGER DEFAULT 0,
-                    quota_exceeded BOOLEAN DEFAULT FALSE,
-                    UNIQUE(phone, period_start)
-                );
-                """)
+                # Check existing tables (diagnostic only)
+                if logger.isEnabledFor(logging.DEBUG):
+                    c.execute("""
+                        SELECT table_name FROM information_schema.tables 
+                        WHERE table_schema = 'public'
+                    """)
+                    existing_tables = [row['table_name'] for row in c.fetchall()]
+                    logger.debug("📊 Existing tables: %s", existing_tables)
                 
-                c.execute("""
-                CREATE TABLE IF NOT EXISTS subscription_events (
-                    id SERIAL PRIMARY KEY,
-                    event_type VARCHAR(100) NOT NULL,
-                    stripe_customer_id VARCHAR(100),
-                    subscription_id VARCHAR(100),
-                    phone VARCHAR(20),
-                    status VARCHAR(50),
-                    event_data TEXT,
-                    processed BOOLEAN DEFAULT TRUE,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                """)
+                # The whole schema in one round trip; the legacy import needs the
+                # whitelist table, so it follows
+                c.execute(SCHEMA_DDL, prepare=False)
+                migrate_legacy_whitelist(c)
                 
-                conn.commit()
                 logger.info(f"📊 All PostgreSQL tables created/verified")
                 
-                # Check for existing data
-                c.execute("SELECT COUNT(*) as count FROM user_profiles")
-                user_count = c.fetchone()['count']
-                
-                c.execute("SELECT COUNT(*) as count FROM messages")  
-                message_count = c.fetchone()['count']
+                # Check for existing data (diagnostic only): planner row estimates
+                # from pg_class, not COUNT(*), which would scan the whole messages table
+                if logger.isEnabledFor(logging.DEBUG):
+                    c.execute("""
+                        SELECT relname, GREATEST(reltuples, 0)::bigint AS estimate
+                        FROM pg_class
+                        WHERE relnamespace = 'public'::regnamespace
+                          AND relname IN ('user_profiles', 'messages', 'whitelist')
+                    """)
+                    row_estimates = {row['relname']: row['estimate'] for row in c.fetchall()}
+                    logger.debug("📊 Found ~%s user profiles, ~%s messages and ~%s whitelist entries",
+                                 row_estimates.get('user_profiles', 0), row_estimates.get('messages', 0),
+                                 row_estimates.get('whitelist', 0))
                 
                 logger.info(f"📊 PostgreSQL database initialized successfully")
-                logger.info(f"📊 Found {user_count} user profiles and {message_count} messages")
                 
     except Exception as e:
         logger.error(f"💥 PostgreSQL database initialization error: {e}")
         raise
 
+# === Onboarding State Cache ===
+# Users mid-onboarding send a couple of quick replies in a row; keep their
+# step and first name in memory so those replies don't re-read the profile.
+# Filled by create/update_user_profile; the app runs one gunicorn worker
+# (Procfile, render.yaml), so every step change goes through this process.
+_onboarding_state = TTLCache(maxsize=50_000, ttl=1800)
+_onboarding_lock = threading.Lock()
+
+def get_onboarding_state(phone):
+    """Return cached {'step', 'first_name'} for a user mid-onboarding, or None"""
+    with _onboarding_lock:
+        return _onboarding_state.get(phone)
+
+def set_onboarding_state(phone, step, first_name=None):
+    with _onboarding_lock:
+        _onboarding_state[phone] = {'step': step, 'first_name': first_name}
+
+def clear_onboarding_state(phone):
+    with _onboarding_lock:
+        _onboarding_state.pop(phone, None)
+
+# === User Profile Cache ===
+# Profiles are read on nearly every webhook but change rarely; every write
+# path below invalidates, and the TTL bounds staleness from other workers.
+# Sized for the whole active user base: entries are a handful of short fields.
+_profile_cache = TTLCache(maxsize=10_000, ttl=60)
+_profile_lock = threading.Lock()
+_PROFILE_MISSING = object()
+
+def invalidate_user_profile(phone):
+    with _profile_lock:
+        _profile_cache.pop(phone, None)
+
 # === User Profile Functions ===
+PROFILE_COLUMNS = """first_name, location, onboarding_step, onboarding_completed,
+                     stripe_customer_id, subscription_status"""
+
+def profile_from_row(row):
+    return {
+        'first_name': row['first_name'],
+        'location': row['location'],
+        'onboarding_step': row['onboarding_step'],
+        'onboarding_completed': bool(row['onboarding_completed']),
+        'stripe_customer_id': row['stripe_customer_id'],
+        'subscription_status': row['subscription_status']
+    }
+
 def get_user_profile(phone):
     """Get user profile and onboarding status"""
+    with _profile_lock:
+        cached = _profile_cache.get(phone, _PROFILE_MISSING)
+    if cached is not _PROFILE_MISSING:
+        return cached
+    
     try:
         with get_db_connection() as conn:
             with conn.cursor() as c:
-                c.execute("""
-                    SELECT first_name, location, onboarding_step, onboarding_completed, 
-                           stripe_customer_id, subscription_status
+                c.execute(f"""
+                    SELECT {PROFILE_COLUMNS}
                     FROM user_profiles
                     WHERE phone = %s
                 """, (phone,))
                 result = c.fetchone()
+                profile = profile_from_row(result) if result else None
                 
-                if result:
-                    return {
-                        'first_name': result['first_name'],
-                        'location': result['location'],
-                        'onboarding_step': result['onboarding_step'],
-                        'onboarding_completed': bool(result['onboarding_completed']),
-                        'stripe_customer_id': result['stripe_customer_id'],
-                        'subscription_status': result['subscription_status']
-                    }
-                else:
-                    return None
+                # Misses are cached too so unknown numbers don't hit the DB each time
+                with _profile_lock:
+                    _profile_cache[phone] = profile
+                return profile
     except Exception as e:
         logger.error(f"Error getting user profile for {phone}: {e}")
         return None
@@ -827,15 +1219,24 @@ def create_user_profile(phone):
     """Create new user profile for onboarding"""
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as c:
-                c.execute("""
-                    INSERT INTO user_profiles (phone, onboarding_step, onboarding_completed)
-                    VALUES (%s, 1, FALSE)
-                    ON CONFLICT (phone) DO NOTHING
-                """, (phone,))
-                conn.commit()
+            # RETURNING hands back the new row in the same round trip; no row
+            # means the profile already existed
+            row = conn.execute(f"""
+                INSERT INTO user_profiles (phone, onboarding_step, onboarding_completed)
+                VALUES (%s, 1, FALSE)
+                ON CONFLICT (phone) DO NOTHING
+                RETURNING {PROFILE_COLUMNS}
+            """, (phone,)).fetchone()
+            
+            if row:
+                with _profile_lock:
+                    _profile_cache[phone] = profile_from_row(row)
+                set_onboarding_state(phone, 1)
                 logger.info(f"📝 Created user profile for {phone}")
-                return True
+            else:
+                invalidate_user_profile(phone)
+                logger.debug("📝 User profile already exists for %s", phone)
+            return True
     except Exception as e:
         logger.error(f"Error creating user profile for {phone}: {e}")
         return False
@@ -843,97 +1244,109 @@ def create_user_profile(phone):
 def update_user_profile(phone, first_name=None, location=None, onboarding_step=None, 
                        onboarding_completed=None, stripe_customer_id=None, 
                        subscription_status=None, subscription_id=None):
-    """Update user profile information"""
+    """Update (or create) a user profile; fields left as None keep their current value.
+    
+    Returns the profile as stored, or None on error.
+    """
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as c:
-                
-                update_parts = []
-                params = []
-                
-                if first_name is not None:
-                    update_parts.append("first_name = %s")
-                    params.append(first_name)
-                
-                if location is not None:
-                    update_parts.append("location = %s")
-                    params.append(location)
-                
-                if onboarding_step is not None:
-                    update_parts.append("onboarding_step = %s")
-                    params.append(onboarding_step)
-                
-                if onboarding_completed is not None:
-                    update_parts.append("onboarding_completed = %s")
-                    params.append(onboarding_completed)
-                
-                if stripe_customer_id is not None:
-                    update_parts.append("stripe_customer_id = %s")
-                    params.append(stripe_customer_id)
-                
-                if subscription_status is not None:
-                    update_parts.append("subscription_status = %s")
-                    params.append(subscription_status)
-                
-                if subscription_id is not None:
-                    update_parts.append("subscription_id = %s")
-                    params.append(subscription_id)
-                
-                update_parts.append("updated_date = CURRENT_TIMESTAMP")
-                params.append(phone)
-                
-                query = f"""
-                    UPDATE user_profiles 
-                    SET {', '.join(update_parts)}
-                    WHERE phone = %s
-                """
-                
-                c.execute(query, params)
-                conn.commit()
-                logger.info(f"📝 Updated user profile for {phone}")
-                return True
+            # Upsert so writes for a number without a profile yet (e.g. a Stripe
+            # subscription arriving first) aren't dropped; one static statement
+            # for every field combination, so psycopg can prepare it once
+            row = conn.execute(f"""
+                INSERT INTO user_profiles
+                    (phone, first_name, location, onboarding_step, onboarding_completed,
+                     stripe_customer_id, subscription_status, subscription_id)
+                VALUES (%(phone)s, %(first_name)s, %(location)s,
+                        COALESCE(%(onboarding_step)s, 1), COALESCE(%(onboarding_completed)s, FALSE),
+                        %(stripe_customer_id)s, %(subscription_status)s, %(subscription_id)s)
+                ON CONFLICT (phone) DO UPDATE
+                SET first_name = COALESCE(%(first_name)s, user_profiles.first_name),
+                    location = COALESCE(%(location)s, user_profiles.location),
+                    onboarding_step = COALESCE(%(onboarding_step)s, user_profiles.onboarding_step),
+                    onboarding_completed = COALESCE(%(onboarding_completed)s, user_profiles.onboarding_completed),
+                    stripe_customer_id = COALESCE(%(stripe_customer_id)s, user_profiles.stripe_customer_id),
+                    subscription_status = COALESCE(%(subscription_status)s, user_profiles.subscription_status),
+                    subscription_id = COALESCE(%(subscription_id)s, user_profiles.subscription_id),
+                    updated_date = CURRENT_TIMESTAMP
+                RETURNING {PROFILE_COLUMNS}
+            """, {
+                'phone': phone,
+                'first_name': first_name,
+                'location': location,
+                'onboarding_step': onboarding_step,
+                'onboarding_completed': onboarding_completed,
+                'stripe_customer_id': stripe_customer_id,
+                'subscription_status': subscription_status,
+                'subscription_id': subscription_id,
+            }).fetchone()
+            
+            profile = profile_from_row(row)
+            with _profile_lock:
+                _profile_cache[phone] = profile
+            if profile['onboarding_completed']:
+                clear_onboarding_state(phone)
+            else:
+                set_onboarding_state(phone, profile['onboarding_step'], profile['first_name'])
+            logger.info(f"📝 Updated user profile for {phone}")
+            return profile
     except Exception as e:
         logger.error(f"Error updating user profile for {phone}: {e}")
-        return False
+        return None
 
 def is_user_onboarded(phone):
     """Check if user has completed onboarding"""
     profile = get_user_profile(phone)
     return profile and profile['onboarding_completed']
 
-def get_user_context_for_queries(phone):
-    """Get user context to personalize responses"""
-    profile = get_user_profile(phone)
+@lru_cache(maxsize=1024)
+def personal_system_prompt(first_name, location):
+    """Per-user Claude context; built once per (name, location), not per message"""
+    return f"The user's name is {first_name} and they live in {location}."
+
+def get_user_context_for_queries(phone, profile=None):
+    """Get user context to personalize responses; pass `profile` if it's already loaded"""
+    if profile is None:
+        profile = get_user_profile(phone)
     if profile and profile['onboarding_completed']:
         return {
             'first_name': profile['first_name'],
             'location': profile['location'],
+            'system_prompt': personal_system_prompt(profile['first_name'], profile['location']),
             'personalized': True
         }
     return {'personalized': False}
 
 def log_onboarding_step(phone, step, response):
     """Log onboarding step response"""
-    try:
-        with get_db_connection() as conn:
-            with conn.cursor() as c:
-                c.execute("""
-                    INSERT INTO onboarding_log (phone, step, response)
-                    VALUES (%s, %s, %s)
-                """, (phone, step, response))
-                conn.commit()
-    except Exception as e:
-        logger.error(f"Error logging onboarding step: {e}")
+    enqueue_db_log('onboarding_step', (phone, step, response))
+
+class _NameCharsTable(dict):
+    """str.translate table for first names: keeps ASCII letters, whitespace,
+    hyphens and apostrophes and drops everything else, cached per code point."""
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        keep = (char.isascii() and char.isalpha()) or char.isspace() or char in "-'"
+        mapped = codepoint if keep else None
+        self[codepoint] = mapped
+        return mapped
+
+_NAME_CHARS = _NameCharsTable()
 
 def handle_onboarding_response(phone, message):
     """Handle user responses during onboarding process"""
-    profile = get_user_profile(phone)
+    state = get_onboarding_state(phone)
     
-    if not profile:
-        logger.error(f"No profile found for {phone} during onboarding")
-        return "Sorry, there was an error with your profile. Please contact support."
+    if not state:
+        profile = get_user_profile(phone)
+        
+        if not profile:
+            logger.error(f"No profile found for {phone} during onboarding")
+            return "Sorry, there was an error with your profile. Please contact support."
+        
+        state = {'step': profile['onboarding_step'], 'first_name': profile['first_name']}
     
-    current_step = profile['onboarding_step']
+    current_step = state['step']
     
     if current_step == 1:
         # Collecting first name
@@ -942,14 +1355,14 @@ def handle_onboarding_response(phone, message):
         if len(first_name) < 1 or len(first_name) > 50:
             return "Please enter a valid first name."
         
-        clean_name = re.sub(r"[^a-zA-Z\s\-']", "", first_name)
+        clean_name = first_name.translate(_NAME_CHARS)
         if not clean_name:
             return "Please enter a valid first name using only letters."
         
         update_user_profile(phone, first_name=clean_name, onboarding_step=2)
         log_onboarding_step(phone, 1, clean_name)
         
-        response = ONBOARDING_LOCATION_MSG.format(name=clean_name)
+        response = onboarding_location_msg(clean_name)
         save_message(phone, "assistant", response, "onboarding_location", 0)
         
         logger.info(f"👤 Collected name '{clean_name}' for {phone}, asking for location")
@@ -962,13 +1375,12 @@ def handle_onboarding_response(phone, message):
         if len(location) < 2 or len(location) > 100:
             return "Please enter a valid city name or zip code."
         
-        update_user_profile(phone, location=location, onboarding_step=3, onboarding_completed=True)
+        profile = update_user_profile(phone, location=location, onboarding_step=3, onboarding_completed=True)
         log_onboarding_step(phone, 2, location)
         
-        updated_profile = get_user_profile(phone)
-        first_name = updated_profile['first_name'] if updated_profile else "there"
+        first_name = (profile and profile['first_name']) or state['first_name'] or "there"
         
-        response = ONBOARDING_COMPLETE_MSG.format(name=first_name)
+        response = onboarding_complete_msg(first_name)
         save_message(phone, "assistant", response, "onboarding_complete", 0)
         
         logger.info(f"🎉 Completed onboarding for {phone}: {first_name} in {location}")
@@ -979,26 +1391,100 @@ def handle_onboarding_response(phone, message):
         return "There was an error with your setup. You can now ask me questions!"
 
 # === Whitelist Management ===
-def load_whitelist():
+def migrate_legacy_whitelist(c):
+    """Import numbers from the legacy whitelist file into the whitelist table"""
+    # Import once per database: once the marker is set the file isn't touched
+    c.execute("SELECT 1 FROM schema_migrations WHERE name = 'legacy_whitelist'")
+    if c.fetchone() is not None:
+        return
+    
+    if not os.path.exists(LEGACY_WHITELIST_FILE):
+        return
+    
     try:
-        with open(WHITELIST_FILE, "r") as f:
-            return set(line.strip() for line in f if line.strip())
-    except FileNotFoundError:
-        return set()
+        with open(LEGACY_WHITELIST_FILE, "r") as f:
+            # Stored normalized, like every other whitelist entry, and deduplicated
+            phones = list(dict.fromkeys(
+                normalize_phone_number(line.strip()) for line in f if line.strip()
+            ))
+    except OSError as e:
+        logger.error(f"Error reading legacy whitelist file: {e}")
+        return
+    
+    # The marker commits (or rolls back) together with the inserts in init_db's
+    # transaction
+    c.execute("""
+        INSERT INTO schema_migrations (name) VALUES ('legacy_whitelist')
+        ON CONFLICT (name) DO NOTHING
+    """)
+    
+    # executemany pipelines the inserts: one round trip rather than one per number
+    c.executemany("""
+        INSERT INTO whitelist (phone, added_by)
+        VALUES (%s, 'legacy_migration')
+        ON CONFLICT (phone) DO NOTHING
+    """, [(phone,) for phone in phones])
+    logger.info(f"📋 Migrated {len(phones)} numbers from {LEGACY_WHITELIST_FILE}")
+
+# The full active list, kept briefly; add/remove clear it via invalidate_sender_access()
+_whitelist_cache = TTLCache(maxsize=1, ttl=60)
 
-def log_whitelist_event(phone, action, source='manual'):
-    """Log whitelist addition/removal events"""
+def load_whitelist():
+    """Return the active whitelisted numbers as a frozenset"""
+    with _profile_lock:
+        cached = _whitelist_cache.get('active')
+    if cached is not None:
+        return cached
+    
+    try:
+        # Scalar rows streamed straight into the set: no row list or per-row dicts
+        with get_db_connection() as conn, conn.cursor(row_factory=scalar_row) as c:
+            phones = frozenset(c.execute("SELECT phone FROM whitelist WHERE is_active"))
+    except Exception as e:
+        logger.error(f"Error loading whitelist: {e}")
+        return frozenset()
+    
+    with _profile_lock:
+        _whitelist_cache['active'] = phones
+    return phones
+
+# Whitelist membership per sender, cached next to the profile so repeat messages
+# skip the DB entirely; other workers' changes show up once an entry expires
+_access_cache = TTLCache(maxsize=10_000, ttl=60)
+
+def invalidate_sender_access(phone):
+    with _profile_lock:
+        _access_cache.pop(phone, None)
+        _whitelist_cache.clear()
+
+def get_sender_access(phone):
+    """Return (is_whitelisted, profile) for an inbound sender in one round trip"""
+    with _profile_lock:
+        whitelisted = _access_cache.get(phone)
+        profile = _profile_cache.get(phone, _PROFILE_MISSING)
+    if whitelisted is not None and profile is not _PROFILE_MISSING:
+        return whitelisted, profile
+    
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as c:
-                c.execute("""
-                    INSERT INTO whitelist_events (phone, action, source)
-                    VALUES (%s, %s, %s)
-                """, (phone, action, source))
-                conn.commit()
-                logger.info(f"📋 Logged whitelist event: {action} for {phone} (source: {source})")
+            row = conn.execute(f"""
+                SELECT wl.phone IS NOT NULL AS whitelisted,
+                       up.phone IS NOT NULL AS has_profile,
+                       {PROFILE_COLUMNS}
+                FROM (SELECT %s::varchar AS phone) AS sender
+                LEFT JOIN whitelist wl ON wl.phone = sender.phone AND wl.is_active
+                LEFT JOIN user_profiles up ON up.phone = sender.phone
+            """, (phone,)).fetchone()
     except Exception as e:
-        logger.error(f"Error logging whitelist event: {e}")
+        logger.error(f"Error checking access for {phone}: {e}")
+        return False, None
+    
+    # Seed the profile cache so the webhook's get_user_profile() doesn't query again
+    profile = profile_from_row(row) if row['has_profile'] else None
+    with _profile_lock:
+        _profile_cache[phone] = profile
+        _access_cache[phone] = row['whitelisted']
+    return row['whitelisted'], profile
 
 def add_to_whitelist(phone, send_welcome=True, source='manual'):
     """Enhanced whitelist addition with automatic welcome message and onboarding"""
@@ -1006,38 +1492,50 @@ def add_to_whitelist(phone, send_welcome=True, source='manual'):
         return False
         
     phone = normalize_phone_number(phone)
-    wl = load_whitelist()
     
-    is_new_user = phone not in wl
+    try:
+        with get_db_connection() as conn:
+            # Activate, record the event and test prior membership in one
+            # statement: the upsert skips numbers already active, so no row back
+            # means there was nothing to add
+            added = conn.execute("""
+                WITH added AS (
+                    INSERT INTO whitelist (phone, added_by)
+                    VALUES (%(phone)s, %(source)s)
+                    ON CONFLICT (phone) DO UPDATE
+                    SET is_active = TRUE, added_by = EXCLUDED.added_by, added_date = CURRENT_TIMESTAMP
+                    WHERE whitelist.is_active IS NOT TRUE
+                    RETURNING phone
+                )
+                INSERT INTO whitelist_events (phone, action, source)
+                SELECT phone, 'added', %(source)s FROM added
+                RETURNING id
+            """, {'phone': phone, 'source': source}).fetchone() is not None
+    except Exception as e:
+        logger.error(f"Failed to add {phone} to whitelist: {e}")
+        return False
     
-    if is_new_user:
-        try:
-            with open(WHITELIST_FILE, "a") as f:
-                f.write(phone + "\n")
-            
-            log_whitelist_event(phone, "added", source)
-            logger.info(f"📱 Added new user {phone} to whitelist (source: {source})")
-            
-            create_user_profile(phone)
-            
-            if send_welcome:
-                try:
-                    result = send_sms(phone, ONBOARDING_NAME_MSG, bypass_quota=True)
-                    if "error" not in result:
-                        logger.info(f"🎉 Onboarding started for new user {phone}")
-                        save_message(phone, "assistant", ONBOARDING_NAME_MSG, "onboarding_start", 0)
-                    else:
-                        logger.error(f"Failed to send onboarding SMS to {phone}: {result['error']}")
-                except Exception as sms_error:
-                    logger.error(f"Failed to send onboarding SMS to {phone}: {sms_error}")
-            
-            return True
-        except Exception as e:
-            logger.error(f"Failed to add {phone} to whitelist: {e}")
-            return False
-    else:
+    if not added:
         logger.info(f"📱 {phone} already in whitelist")
         return True
+    
+    invalidate_sender_access(phone)
+    logger.info(f"📱 Added new user {phone} to whitelist (source: {source})")
+    
+    create_user_profile(phone)
+    
+    if send_welcome:
+        try:
+            result = send_sms(phone, ONBOARDING_NAME_MSG, bypass_quota=True)
+            if "error" not in result:
+                logger.info(f"🎉 Onboarding started for new user {phone}")
+                save_message(phone, "assistant", ONBOARDING_NAME_MSG, "onboarding_start", 0)
+            else:
+                logger.error(f"Failed to send onboarding SMS to {phone}: {result['error']}")
+        except Exception as sms_error:
+            logger.error(f"Failed to send onboarding SMS to {phone}: {sms_error}")
+    
+    return True
 
 def remove_from_whitelist(phone, send_goodbye=False):
     """Enhanced whitelist removal with optional goodbye message"""
@@ -1045,35 +1543,49 @@ def remove_from_whitelist(phone, send_goodbye=False):
         return False
         
     phone = normalize_phone_number(phone)
-    wl = load_whitelist()
     
-    if phone in wl:
-        try:
-            wl.remove(phone)
-            with open(WHITELIST_FILE, "w") as f:
-                for num in wl:
-                    f.write(num + "\n")
-            
-            log_whitelist_event(phone, "removed")
-            logger.info(f"📱 Removed {phone} from whitelist")
-            
-            if send_goodbye:
-                goodbye_msg = "Thanks for using Hey Alex! Your subscription has been cancelled. You can resubscribe anytime at heyalex.co Text +18338613041 for questions."
-                try:
-                    send_sms(phone, goodbye_msg, bypass_quota=True)
-                    logger.info(f"👋 Goodbye message sent to {phone}")
-                except Exception as sms_error:
-                    logger.error(f"Failed to send goodbye SMS to {phone}: {sms_error}")
-            
-            return True
-        except Exception as e:
-            logger.error(f"Failed to remove {phone} from whitelist: {e}")
-            return False
-    else:
+    try:
+        with get_db_connection() as conn:
+            # Deactivate, record the event and test membership in one statement:
+            # no row back means the number wasn't active
+            removed = conn.execute("""
+                WITH removed AS (
+                    UPDATE whitelist SET is_active = FALSE
+                    WHERE phone = %s AND is_active
+                    RETURNING phone
+                )
+                INSERT INTO whitelist_events (phone, action, source)
+                SELECT phone, 'removed', 'manual' FROM removed
+                RETURNING id
+            """, (phone,)).fetchone() is not None
+    except Exception as e:
+        logger.error(f"Failed to remove {phone} from whitelist: {e}")
+        return False
+    
+    if not removed:
         logger.info(f"📱 {phone} not in whitelist")
         return True
+    
+    invalidate_sender_access(phone)
+    logger.info(f"📱 Removed {phone} from whitelist")
+    
+    if send_goodbye:
+        goodbye_msg = "Thanks for using Hey Alex! Your subscription has been cancelled. You can resubscribe anytime at heyalex.co Text +18338613041 for questions."
+        try:
+            send_sms(phone, goodbye_msg, bypass_quota=True)
+            logger.info(f"👋 Goodbye message sent to {phone}")
+        except Exception as sms_error:
+            logger.error(f"Failed to send goodbye SMS to {phone}: {sms_error}")
+    
+    return True
 
 # === SMS Functions ===
+# Keep-alive session so each send reuses the TLS connection to ClickSend. No
+# adapter retries: a resent POST could deliver the same SMS twice.
+clicksend_session = requests.Session()
+clicksend_session.auth = (CLICKSEND_USERNAME, CLICKSEND_API_KEY)
+clicksend_session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
 def send_sms(to_number, message, bypass_quota=False):
     if not CLICKSEND_USERNAME or not CLICKSEND_API_KEY:
         logger.error("ClickSend credentials not configured")
@@ -1094,11 +1606,10 @@ def send_sms(to_number, message, bypass_quota=False):
     }]}
     
     try:
-        logger.info(f"📤 Sending SMS to {to_number}: {message[:50]}... (Length: {len(message)} chars)")
+        logger.debug("📤 Sending SMS to %s: %.50s... (Length: %d chars)", to_number, message, len(message))
         
-        resp = requests.post(
+        resp = clicksend_session.post(
             url,
-            auth=(CLICKSEND_USERNAME, CLICKSEND_API_KEY),
             headers=headers,
             json=payload,
             timeout=15
@@ -1114,7 +1625,7 @@ def send_sms(to_number, message, bypass_quota=False):
                     msg_id = messages[0].get("message_id")
                     msg_parts = messages[0].get("message_parts", 1)
                     
-                    logger.info(f"✅ SMS queued successfully to {to_number} ({msg_parts} parts)")
+                    logger.info("✅ SMS queued successfully to %s (%s parts)", to_number, msg_parts)
                     log_sms_delivery(to_number, message, result, msg_status, msg_id)
             
             return result
@@ -1126,17 +1637,70 @@ def send_sms(to_number, message, bypass_quota=False):
         logger.error(f"💥 SMS Exception for {to_number}: {e}")
         return {"error": f"SMS send failed: {str(e)}"}
 
+def send_sms_bulk(recipients, message):
+    """Send the same message to many numbers with one ClickSend request per batch"""
+    if not CLICKSEND_USERNAME or not CLICKSEND_API_KEY:
+        logger.error("ClickSend credentials not configured")
+        return {"error": "SMS service not configured"}
+    
+    if not recipients:
+        return {"error": "No recipients"}
+    
+    url = "https://rest.clicksend.com/v3/sms/send"
+    headers = {"Content-Type": "application/json"}
+    
+    if len(message) > CLICKSEND_MAX_LENGTH:
+        message = message[:CLICKSEND_MAX_LENGTH - 3] + "..."
+        logger.warning(f"📏 Broadcast truncated to ClickSend limit: {CLICKSEND_MAX_LENGTH} chars")
+    
+    queued = 0
+    failed_batches = 0
+    
+    for start in range(0, len(recipients), CLICKSEND_BATCH_SIZE):
+        batch = recipients[start:start + CLICKSEND_BATCH_SIZE]
+        payload = {"messages": [{
+            "source": "+18338613041",
+            "body": message,
+            "to": to_number,
+            "custom_string": "alex_broadcast"
+        } for to_number in batch]}
+        
+        try:
+            logger.info(f"📤 Sending broadcast batch of {len(batch)} SMS: {message[:50]}...")
+            
+            resp = clicksend_session.post(
+                url,
+                headers=headers,
+                json=payload,
+                timeout=30
+            )
+            
+            result = resp.json()
+            
+            if resp.status_code != 200:
+                logger.error(f"❌ ClickSend API Error {resp.status_code}: {result}")
+                failed_batches += 1
+                continue
+            
+            # ClickSend reports the messages in the order they were submitted;
+            # log each against the number we sent rather than its echoed "to"
+            for to_number, msg in zip(batch, result.get("data", {}).get("messages", [])):
+                queued += 1
+                log_sms_delivery(to_number, message, msg, msg.get("status"), msg.get("message_id"))
+                
+        except Exception as e:
+            logger.error(f"💥 Broadcast batch exception: {e}")
+            failed_batches += 1
+    
+    logger.info(f"✅ Broadcast queued {queued}/{len(recipients)} SMS ({failed_batches} failed batches)")
+    return {"queued": queued, "recipients": len(recipients), "failed_batches": failed_batches}
+
 def log_sms_delivery(phone, message_content, clicksend_response, delivery_status, message_id):
-    try:
-        with get_db_connection() as conn:
-            with conn.cursor() as c:
-                c.execute("""
-                    INSERT INTO sms_delivery_log (phone, message_content, clicksend_response, delivery_status, message_id)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (phone, message_content, json.dumps(clicksend_response), delivery_status, message_id))
-                conn.commit()
-    except Exception as e:
-        logger.error(f"Error logging SMS delivery: {e}")
+    if not phone:
+        # sms_delivery_log.phone is NOT NULL; such a row could only fail the insert
+        logger.warning(f"⚠️ Not logging SMS delivery without a phone number (status: {delivery_status})")
+        return
+    enqueue_db_log('sms_delivery', (phone, message_content, clicksend_response, delivery_status, message_id))
 
 def get_last_user_query(phone):
     """Get the last user query for context in longer responses"""
@@ -1160,19 +1724,42 @@ def get_last_user_query(phone):
         logger.error(f"Error getting last user query: {e}")
         return None
 
+# Recent-message tail per number. ask_claude reads history right before its API
+# call; save_message appends here so that read usually skips the database, and
+# the TTL bounds drift from messages saved by other workers.
+HISTORY_CACHE_SIZE = 8
+_history_cache = TTLCache(maxsize=1024, ttl=300)
+_history_lock = threading.Lock()
+
+def invalidate_history(phone):
+    with _history_lock:
+        _history_cache.pop(phone, None)
+
 def save_message(phone, role, content, intent_type=None, response_time_ms=None):
-    try:
-        with get_db_connection() as conn:
-            with conn.cursor() as c:
-                c.execute("""
-                    INSERT INTO messages (phone, role, content, intent_type, response_time_ms) 
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (phone, role, content, intent_type, response_time_ms))
-                conn.commit()
-    except Exception as e:
-        logger.error(f"Error saving message: {e}")
+    params = (phone, role, content, intent_type, response_time_ms)
+    if role == "user":
+        # Written before replying: on a history cache miss ask_claude reads the
+        # conversation back from the database and must see this message
+        try:
+            with get_db_connection() as conn:
+                conn.execute(_DB_LOG_INSERTS['message'], params)
+        except Exception as e:
+            logger.error(f"Error saving message for {phone}, queueing it instead: {e}")
+            enqueue_db_log('message', params)
+    else:
+        enqueue_db_log('message', params)
+    with _history_lock:
+        history = _history_cache.get(phone)
+        if history is not None:
+            history.append({"role": role, "content": content})
 
 def load_history(phone, limit=4):
+    if limit <= HISTORY_CACHE_SIZE:
+        with _history_lock:
+            history = _history_cache.get(phone)
+            if history is not None:
+                return list(history)[-limit:]
+    
     try:
         with get_db_connection() as conn:
             with conn.cursor() as c:
@@ -1182,26 +1769,23 @@ def load_history(phone, limit=4):
                     WHERE phone = %s
                     ORDER BY id DESC
                     LIMIT %s
-                """, (phone, limit))
+                """, (phone, max(limit, HISTORY_CACHE_SIZE)))
                 rows = c.fetchall()
-                return [{"role": row['role'], "content": row['content']} for row in reversed(rows)]
+                history = [{"role": row['role'], "content": row['content']} for row in reversed(rows)]
     except Exception as e:
         logger.error(f"Error loading history: {e}")
         return []
+    
+    with _history_lock:
+        _history_cache[phone] = deque(history[-HISTORY_CACHE_SIZE:], maxlen=HISTORY_CACHE_SIZE)
+    return history[-limit:]
 
 def log_usage_analytics(phone, intent_type, success, response_time_ms):
-    try:
-        with get_db_connection() as conn:
-            with conn.cursor() as c:
-                c.execute("""
-                    INSERT INTO usage_analytics (phone, intent_type, success, response_time_ms)
-                    VALUES (%s, %s, %s, %s)
-                """, (phone, intent_type, success, response_time_ms))
-                conn.commit()
-    except Exception as e:
-        logger.error(f"Error logging usage analytics: {e}")
+    enqueue_db_log('usage_analytics', (phone, intent_type, success, response_time_ms))
 
 # === Content Filter ===
+SHORT_ALLOWED = frozenset(['hi', 'hey', 'hello', 'help', 'yes', 'no', 'ok', 'thanks', 'stop', 'start'])
+
 class ContentFilter:
     def __init__(self):
         self.spam_keywords = {
@@ -1211,24 +1795,31 @@ class ContentFilter:
                 'click here to claim', 'urgent response required'
             ]
         }
+        # One escaped alternation per category: a single pass over the text finds
+        # any keyword, however long the lists grow
+        self.spam_patterns = {
+            category: re.compile('|'.join(map(re.escape, keywords)))
+            for category, keywords in self.spam_keywords.items()
+        }
         
-        self.question_patterns = [
-            r'\b(what|who|when|where|why|how|do|does|is|are|can|will|would|should)\b.*\?',
-            r'\b(free will|philosophy|philosophical|ethics|moral|meaning)\b',
-            r'\b(illusion|reality|consciousness|existence|purpose)\b'
-        ]
+        # Compiled once as a single alternation: one scan per message instead of three
+        self.question_pattern = re.compile(
+            r'\b(?:what|who|when|where|why|how|do|does|is|are|can|will|would|should)\b.*\?'
+            r'|\b(?:free will|philosophy|philosophical|ethics|moral|meaning)\b'
+            r'|\b(?:illusion|reality|consciousness|existence|purpose)\b',
+            re.IGNORECASE
+        )
     
     def is_spam(self, text: str) -> tuple[bool, str]:
-        text_lower = text.lower().strip()
-        
-        for pattern in self.question_patterns:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                return False, ""
+        return self._check_spam(text.lower().strip())
+    
+    def _check_spam(self, text_lower: str) -> tuple[bool, str]:
+        if self.question_pattern.search(text_lower):
+            return False, ""
         
-        for category, keywords in self.spam_keywords.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    return True, f"Spam detected: {category}"
+        for category, pattern in self.spam_patterns.items():
+            if pattern.search(text_lower):
+                return True, f"Spam detected: {category}"
         
         return False, ""
     
@@ -1239,11 +1830,12 @@ class ContentFilter:
         if len(text) > 500:
             return False, "Query too long"
         
-        short_allowed = ['hi', 'hey', 'hello', 'help', 'yes', 'no', 'ok', 'thanks', 'stop', 'start']
-        if text.lower() in short_allowed:
+        # Lowercased once for both the short-reply check and the spam patterns
+        text_lower = text.lower()
+        if text_lower in SHORT_ALLOWED:
             return True, ""
         
-        is_spam, spam_reason = self.is_spam(text)
+        is_spam, spam_reason = self._check_spam(text_lower)
         if is_spam:
             return False, spam_reason
         
@@ -1252,51 +1844,49 @@ class ContentFilter:
 content_filter = ContentFilter()
 
 # === Intent Detection ===
+# One precompiled alternation so the message is scanned once, not once per keyword
+WEATHER_PATTERN = re.compile(r'\b(?:weather|temperature|forecast|rain|snow|sunny)\b', re.I)
+
 def detect_weather_intent(text: str) -> Optional[IntentResult]:
-    weather_patterns = [
-        r'\bweather\b',
-        r'\btemperature\b',
-        r'\bforecast\b',
-        r'\brain\b',
-        r'\bsnow\b',
-        r'\bsunny\b'
-    ]
-    
-    if any(re.search(pattern, text, re.I) for pattern in weather_patterns):
+    if WEATHER_PATTERN.search(text):
         return IntentResult("weather", {})
     return None
 
+LONGER_KEYWORDS = [
+    # Direct requests
+    'longer', 'more info', 'more details', 'expand', 'tell me more', 'full details',
+    'more', 'continue', 'go on', 'elaborate', 'explain more', 'details',
+    'full story', 'complete info', 'everything', 'all of it',
+
+    # Question-based
+    'what else', 'anything else', 'what more', 'tell me everything', 
+    'full info', 'complete details',
+
+    # Continuation
+    'keep going', 'more please', 'continue that', 'finish that',
+
+    # Depth requests  
+    'deeper', 'in depth', 'comprehensive', 'thorough', 'breakdown', 'analysis',
+
+    # Specific follow-ups
+    'schedule', 'forecast', 'menu', 'hours', 'ratings'
+]
+
+# Plain substring matches, so the keywords are escaped into one alternation
+# (no word boundaries) and the message is scanned once
+LONGER_PATTERN = re.compile('|'.join(map(re.escape, LONGER_KEYWORDS)))
+LONGER_SHORT_TRIGGERS = frozenset(['??', 'and?', 'yep', 'yes'])
+
 def detect_longer_request(text: str) -> bool:
     """Check if user is requesting a longer response"""
-    longer_keywords = [
-        # Direct requests
-        'longer', 'more info', 'more details', 'expand', 'tell me more', 'full details',
-        'more', 'continue', 'go on', 'elaborate', 'explain more', 'details',
-        'full story', 'complete info', 'everything', 'all of it',
-        
-        # Question-based
-        'what else', 'anything else', 'what more', 'tell me everything', 
-        'full info', 'complete details',
-        
-        # Continuation
-        'keep going', 'more please', 'continue that', 'finish that',
-        
-        # Depth requests  
-        'deeper', 'in depth', 'comprehensive', 'thorough', 'breakdown', 'analysis',
-        
-        # Specific follow-ups
-        'schedule', 'forecast', 'menu', 'hours', 'ratings'
-    ]
-    
     text_lower = text.lower().strip()
     
     # Check exact matches
-    if any(keyword in text_lower for keyword in longer_keywords):
+    if LONGER_PATTERN.search(text_lower):
         return True
     
     # Check short casual responses (be careful with context)
-    short_triggers = ['??', 'and?', 'yep', 'yes']
-    if text_lower in short_triggers:
+    if text_lower in LONGER_SHORT_TRIGGERS:
         return True
     
     # Pattern matching for "what about..."
@@ -1319,6 +1909,37 @@ def detect_intent(text: str, phone: str = None) -> Optional[IntentResult]:
     return None
 
 # === Web Search ===
+SERPAPI_TIMEOUT = (3.05, 5)   # (connect, read) seconds
+
+# Keep-alive session so repeat searches reuse the TCP/TLS connection to serpapi.com;
+# transient failures (connect/read errors, 502-504) are retried once by the adapter
+serpapi_session = requests.Session()
+serpapi_session.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=1, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+))
+
+# Formatted search replies keyed on (normalized query, num); results move on the
+# minutes-to-hours scale so a short TTL absorbs repeat questions and retries
+_search_cache = TTLCache(maxsize=1024, ttl=600)
+_search_lock = threading.Lock()
+
+# Pleasantries that don't change what gets searched, so "hey, weather please?"
+# and "weather" share a cache entry; every other word is kept, in order
+SEARCH_PLEASANTRIES = frozenset({'please', 'pls', 'plz', 'hey', 'thanks', 'thx'})
+SEARCH_POLITE_PREFIXES = (('can', 'you', 'tell', 'me'), ('could', 'you', 'tell', 'me'))
+_SEARCH_KEY_PUNCTUATION = str.maketrans('', '', '?!,;:"')
+
+def search_cache_key(q, num):
+    words = [w for w in q.lower().translate(_SEARCH_KEY_PUNCTUATION).split()
+             if w not in SEARCH_PLEASANTRIES]
+    for prefix in SEARCH_POLITE_PREFIXES:
+        if tuple(words[:len(prefix)]) == prefix:
+            words = words[len(prefix):]
+            break
+    return " ".join(words) or q.lower(), min(num, 5)
+
 def web_search(q, num=3, search_type="general"):
     if not SERPAPI_API_KEY:
         logger.warning("❌ SERPAPI_API_KEY not configured - search unavailable")
@@ -1328,6 +1949,13 @@ def web_search(q, num=3, search_type="general"):
     if len(q) < 2:
         return "Search query too short."
     
+    cache_key = search_cache_key(q, num)
+    with _search_lock:
+        cached = _search_cache.get(cache_key)
+    if cached is not None:
+        logger.debug("🔍 Search cache hit: %s", q)
+        return cached
+    
     url = "https://serpapi.com/search.json"
     params = {
         "engine": "google",
@@ -1340,13 +1968,13 @@ def web_search(q, num=3, search_type="general"):
     
     try:
         logger.info(f"🔍 Searching: {q}")
-        r = requests.get(url, params=params, timeout=15)
+        r = serpapi_session.get(url, params=params, timeout=SERPAPI_TIMEOUT)
         
         if r.status_code != 200:
             logger.error(f"❌ Search API error: {r.status_code}")
             return f"Search temporarily unavailable. Try again later."
             
-        data = r.json()
+        data = orjson.loads(r.content)
         logger.info(f"✅ Search response received")
         
         if 'error' in data:
@@ -1366,23 +1994,33 @@ def web_search(q, num=3, search_type="general"):
         result = f"{title}"
         if snippet:
             result += f" — {snippet}"
-        
-        return truncate_response(result, MAX_SMS_LENGTH)
+    else:
+        result = f"No results found for '{q}'."
     
-    return f"No results found for '{q}'."
+    with _search_lock:
+        _search_cache[cache_key] = result
+    return result
 
 # === Claude Integration ===
-def ask_claude(phone, user_msg):
-    start_time = time.time()
-    
-    if not anthropic_client:
-        logger.warning("❌ ANTHROPIC_API_KEY not configured - Claude unavailable")
-        return "I'd love to help with that question, but my AI service isn't configured right now. Let me try to search for that information instead."
-    
-    try:
-        history = load_history(phone, limit=4)
-        
-        system_context = f"""You are Alex, a helpful SMS assistant that helps people stay connected to information without spending time online. 
+# Checked in order, so a "let me search for" phrasing wins over a bare "search for"
+SEARCH_SUGGESTION_PATTERNS = tuple(re.compile(p, re.I) for p in (
+    r'let me search for (.+?)(?:\.|$)',
+    r'i can search for (.+?)(?:\.|$)',
+    r'search for (.+?)(?:\.|$)'
+))
+
+# Keep-alive session for api.anthropic.com, same reasoning as clicksend_session
+anthropic_session = requests.Session()
+anthropic_session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
+CLAUDE_HEADERS = {
+    "Content-Type": "application/json",
+    "X-API-Key": ANTHROPIC_API_KEY,
+    "anthropic-version": "2023-06-01"
+}
+
+# Shared by every request, so it is built once here rather than per call
+CLAUDE_SYSTEM_PROMPT = f"""You are Alex, a helpful SMS assistant that helps people stay connected to information without spending time online. 
 
 IMPORTANT GUIDELINES:
 - Provide comprehensive responses up to {MAX_SMS_LENGTH} characters (480 chars = 3 SMS parts)
@@ -1399,14 +2037,52 @@ IMPORTANT GUIDELINES:
 - For sports queries, include scores, records, recent games, and key details
 - For weather, include current conditions and forecast highlights
 - For restaurants/businesses, include hours, contact info, and key details"""
+
+CLAUDE_TIMEOUT = (3.05, 15)     # (connect, read) seconds
+CLAUDE_STREAM_BUDGET = 15       # seconds for the whole streamed reply
+
+def read_claude_stream(response, max_chars):
+    """Collect reply text from a streamed Messages API response.
+    
+    Stops once more than max_chars have arrived (truncate_response trims the
+    rest to a sentence end anyway) or the time budget runs out, and returns
+    what was received.
+    """
+    deadline = time.monotonic() + CLAUDE_STREAM_BUDGET
+    parts = []
+    received = 0
+    for line in response.iter_lines():
+        if not line.startswith(b"data:"):
+            continue
+        event = orjson.loads(line[5:])
+        event_type = event.get("type")
+        if event_type == "content_block_delta":
+            text = event.get("delta", {}).get("text", "")
+            parts.append(text)
+            received += len(text)
+            if received > max_chars:
+                break
+        elif event_type == "message_stop":
+            break
+        elif event_type == "error":
+            raise Exception(f"Stream error: {event.get('error')}")
+        if time.monotonic() > deadline:
+            logger.warning(f"⏱️ Claude stream exceeded {CLAUDE_STREAM_BUDGET}s, using partial reply")
+            break
+    return "".join(parts)
+
+def ask_claude(phone, user_msg, system=None):
+    """Ask Claude for a reply; `system` carries optional per-user context"""
+    start_ns = time.perf_counter_ns()
+    
+    if not ANTHROPIC_API_KEY:
+        logger.warning("❌ ANTHROPIC_API_KEY not configured - Claude unavailable")
+        return "I'd love to help with that question, but my AI service isn't configured right now. Let me try to search for that information instead."
+    
+    try:
+        history = load_history(phone, limit=4)
         
         try:
-            headers = {
-                "Content-Type": "application/json",
-                "X-API-Key": ANTHROPIC_API_KEY,
-                "anthropic-version": "2023-06-01"
-            }
-            
             messages = []
             for msg in history[-3:]:
                 messages.append({
@@ -1418,32 +2094,39 @@ IMPORTANT GUIDELINES:
                 "content": user_msg
             })
             
+            wants_longer = "longer" in user_msg.lower()
             data = {
                 "model": "claude-3-haiku-20240307",
-                "max_tokens": 300 if "longer" in user_msg.lower() else 150,
+                # Headroom past the SMS cap so replies reach a sentence end
+                # before max_tokens; the stream read stops at the cap instead
+                "max_tokens": 300 if wants_longer else 150,
                 "temperature": 0.3,
-                "system": system_context,
-                "messages": messages
+                # Shared instructions first, per-user context after
+                "system": [
+                    {"type": "text", "text": CLAUDE_SYSTEM_PROMPT}
+                ] + ([{"type": "text", "text": system}] if system else []),
+                "messages": messages,
+                # Streamed so the read can stop as soon as an SMS worth of text is in
+                "stream": True
             }
             
-            logger.info(f"🤖 Calling Claude API")
+            logger.debug("🤖 Calling Claude API")
             
-            response = requests.post(
+            with anthropic_session.post(
                 "https://api.anthropic.com/v1/messages",
-                headers=headers,
+                headers=CLAUDE_HEADERS,
                 json=data,
-                timeout=15
-            )
-            
-            logger.info(f"📡 Claude API response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                result = response.json()
-                reply = result.get("content", [{}])[0].get("text", "").strip()
-                logger.info(f"✅ Claude responded successfully (length: {len(reply)} chars)")
-            else:
-                logger.error(f"❌ Claude API error: {response.status_code}")
-                raise Exception(f"API call failed with status {response.status_code}")
+                stream=True,
+                timeout=CLAUDE_TIMEOUT
+            ) as response:
+                logger.debug("📡 Claude API response status: %s", response.status_code)
+                
+                if response.status_code == 200:
+                    reply = read_claude_stream(response, LONGER_SMS_LENGTH if wants_longer else MAX_SMS_LENGTH).strip()
+                    logger.info("✅ Claude responded successfully (length: %d chars)", len(reply))
+                else:
+                    logger.error(f"❌ Claude API error: {response.status_code}")
+                    raise Exception(f"API call failed with status {response.status_code}")
                 
         except Exception as e:
             logger.error(f"💥 Claude API exception: {e}")
@@ -1453,50 +2136,70 @@ IMPORTANT GUIDELINES:
             logger.warning("⚠️ Claude returned empty response")
             return "I'm having trouble processing that question. Let me try to search for that information instead."
         
-        # Check if Claude suggests a search
-        search_suggestion_patterns = [
-            r'let me search for (.+?)(?:\.|$)',
-            r'i can search for (.+?)(?:\.|$)',
-            r'search for (.+?)(?:\.|$)'
-        ]
-        
-        for pattern in search_suggestion_patterns:
-            match = re.search(pattern, reply, re.I)
-            if match:
-                search_term = match.group(1).strip()
-                logger.info(f"🔍 Claude suggested search for: {search_term}")
-                search_result = web_search(search_term, search_type="general")
-                return search_result
-        
-        truncated_reply = truncate_response(reply, MAX_SMS_LENGTH)
-        
-        if len(truncated_reply) < len(reply):
-            logger.info(f"📏 Claude response truncated from {len(reply)} to {len(truncated_reply)} chars")
-            
-        response_time = int((time.time() - start_time) * 1000)
+        # Check if Claude suggests a search. Every pattern needs "search for", so
+        # one substring test spares the regex passes on ordinary answers.
+        if "search for" in reply.lower():
+            for pattern in SEARCH_SUGGESTION_PATTERNS:
+                match = pattern.search(reply)
+                if match:
+                    search_term = match.group(1).strip()
+                    logger.info(f"🔍 Claude suggested search for: {search_term}")
+                    search_result = web_search(search_term, search_type="general")
+                    return search_result
+        
+        response_time = (time.perf_counter_ns() - start_ns) // 1_000_000
         log_usage_analytics(phone, "claude_chat", True, response_time)
         
-        return truncated_reply
+        return reply
         
     except Exception as e:
         logger.error(f"💥 Claude integration error for {phone}: {e}")
         return "I'm having trouble processing that question. Let me try to search for that information instead."
 
 # === Stripe Functions ===
+STRIPE_EVENT_INSERT = """
+    INSERT INTO subscription_events (event_type, stripe_customer_id, subscription_id, phone, status, event_data)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
 def log_stripe_event(event_type, customer_id, subscription_id, phone, status, additional_data=None):
     """Log Stripe webhook events for debugging"""
     try:
         with get_db_connection() as conn:
             with conn.cursor() as c:
-                c.execute("""
-                    INSERT INTO subscription_events (event_type, stripe_customer_id, subscription_id, phone, status, event_data)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (event_type, customer_id, subscription_id, phone, status, json.dumps(additional_data or {})))
-                conn.commit()
+                # Prepared from its first run on a connection rather than its
+                # second (prepare_threshold): Stripe events are spread thin
+                # across the pooled connections
+                c.execute(STRIPE_EVENT_INSERT,
+                          (event_type, customer_id, subscription_id, phone, status, json.dumps(additional_data or {})),
+                          prepare=True)
                 logger.info(f"📋 Logged Stripe event: {event_type} for customer {customer_id}")
     except Exception as e:
         logger.error(f"Error logging Stripe event: {e}")
 
+def claim_stripe_event(event_id, event_type):
+    """Record a Stripe event id; False if it was already received (a redelivery)"""
+    try:
+        with get_db_connection() as conn:
+            return conn.execute("""
+                INSERT INTO stripe_webhook_events (event_id, event_type)
+                VALUES (%s, %s)
+                ON CONFLICT (event_id) DO NOTHING
+                RETURNING event_id
+            """, (event_id, event_type)).fetchone() is not None
+    except Exception as e:
+        # Better to risk handling an event twice than to drop it
+        logger.error(f"Error recording Stripe event {event_id}: {e}")
+        return True
+
+def release_stripe_event(event_id):
+    """Forget a claimed event whose processing failed, so Stripe's retry is handled"""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("DELETE FROM stripe_webhook_events WHERE event_id = %s", (event_id,))
+    except Exception as e:
+        logger.error(f"Error releasing Stripe event {event_id}: {e}")
+
 def extract_phone_from_stripe_metadata(metadata):
     """Extract phone number from Stripe customer metadata"""
     phone_fields = ['phone', 'phone_number', 'mobile', 'cell', 'sms_number']
@@ -1524,14 +2227,18 @@ def handle_subscription_created(subscription):
             phone = normalize_phone_number(customer['phone'])
         
         if phone:
-            update_user_profile(
+            # Failures raise so process_stripe_event retries the event; both
+            # steps are safe to repeat (a re-add doesn't resend the welcome)
+            if update_user_profile(
                 phone, 
                 stripe_customer_id=customer_id,
                 subscription_status=status,
                 subscription_id=subscription_id
-            )
+            ) is None:
+                raise RuntimeError(f"profile update failed for {phone}")
             
-            add_to_whitelist(phone, send_welcome=True, source='stripe_subscription')
+            if not add_to_whitelist(phone, send_welcome=True, source='stripe_subscription'):
+                raise RuntimeError(f"whitelist add failed for {phone}")
             log_stripe_event('subscription_created', customer_id, subscription_id, phone, status)
             
             logger.info(f"✅ Subscription activated for {phone}")
@@ -1544,6 +2251,7 @@ def handle_subscription_created(subscription):
         logger.error(f"❌ Error handling subscription creation: {e}")
         log_stripe_event('subscription_created', customer_id, subscription_id, None, 'error', 
                         {'error': str(e)})
+        raise
 
 def handle_subscription_deleted(subscription):
     """Handle subscription cancellation"""
@@ -1564,8 +2272,12 @@ def handle_subscription_deleted(subscription):
                 if result:
                     phone = result['phone']
                     
-                    update_user_profile(phone, subscription_status='cancelled')
-                    remove_from_whitelist(phone, send_goodbye=True)
+                    # Failures raise so process_stripe_event retries the event;
+                    # a repeat removal finds the number inactive and sends nothing
+                    if update_user_profile(phone, subscription_status='cancelled') is None:
+                        raise RuntimeError(f"profile update failed for {phone}")
+                    if not remove_from_whitelist(phone, send_goodbye=True):
+                        raise RuntimeError(f"whitelist removal failed for {phone}")
                     log_stripe_event('subscription_deleted', customer_id, subscription_id, phone, 'cancelled')
                     
                     logger.info(f"✅ Subscription cancelled for {phone}")
@@ -1578,6 +2290,7 @@ def handle_subscription_deleted(subscription):
         logger.error(f"❌ Error handling subscription deletion: {e}")
         log_stripe_event('subscription_deleted', customer_id, subscription_id, None, 'error',
                         {'error': str(e)})
+        raise
 
 # === ADMIN ENDPOINTS ===
 @app.route('/admin/remove-user', methods=['POST'])
@@ -1599,18 +2312,21 @@ def admin_remove_user():
         if success:
             actions_taken.append("Removed from whitelist")
         
+        # Write out queued replies and logs first so none land after the delete
+        flush_db_logs()
+        
         # Remove user profile and related data
         try:
             with get_db_connection() as conn:
-                with conn.cursor() as c:
+                with conn.transaction(), conn.cursor() as c:
                     
-                    # Get user info before deletion for logging
-                    c.execute("SELECT first_name, location FROM user_profiles WHERE phone = %s", (phone,))
+                    # Delete user profile, keeping its info for logging
+                    c.execute("""
+                        DELETE FROM user_profiles WHERE phone = %s
+                        RETURNING first_name, location
+                    """, (phone,))
                     user_info = c.fetchone()
-                    
-                    # Delete user profile
-                    c.execute("DELETE FROM user_profiles WHERE phone = %s", (phone,))
-                    profile_deleted = c.rowcount
+                    profile_deleted = 1 if user_info else 0
                     
                     # Delete messages
                     c.execute("DELETE FROM messages WHERE phone = %s", (phone,))
@@ -1644,7 +2360,15 @@ def admin_remove_user():
                     """, (phone,))
                     subscription_events_updated = c.rowcount
                     
-                    conn.commit()
+                    # Log the removal
+                    c.execute("""
+                        INSERT INTO onboarding_log (phone, step, response, timestamp)
+                        VALUES (%s, -999, %s, CURRENT_TIMESTAMP)
+                    """, (phone, f"REMOVED: User and all data deleted by admin"))
+                    
+                    invalidate_user_profile(phone)
+                    clear_onboarding_state(phone)
+                    invalidate_history(phone)
                     
                     if profile_deleted > 0:
                         actions_taken.append(f"Deleted user profile")
@@ -1662,14 +2386,6 @@ def admin_remove_user():
                         actions_taken.append(f"Deleted {whitelist_events_deleted} whitelist events")
                     if subscription_events_updated > 0:
                         actions_taken.append(f"Updated {subscription_events_updated} subscription events")
-                    
-                    # Log the removal
-                    c.execute("""
-                        INSERT INTO onboarding_log (phone, step, response, timestamp)
-                        VALUES (%s, -999, %s, CURRENT_TIMESTAMP)
-                    """, (phone, f"REMOVED: User and all data deleted by admin"))
-                    
-                    conn.commit()
                     actions_taken.append("Logged user removal")
                     
                     user_name = user_info['first_name'] if user_info else "Unknown"
@@ -1710,9 +2426,12 @@ def admin_reset_user():
         
         actions_taken = []
         
+        # Write out queued replies and logs first so none land after the delete
+        flush_db_logs()
+        
         try:
             with get_db_connection() as conn:
-                with conn.cursor() as c:
+                with conn.transaction(), conn.cursor() as c:
                     
                     # Get user info
                     c.execute("SELECT first_name, location FROM user_profiles WHERE phone = %s", (phone,))
@@ -1733,7 +2452,13 @@ def admin_reset_user():
                     c.execute("DELETE FROM usage_analytics WHERE phone = %s", (phone,))
                     analytics_cleared = c.rowcount
                     
-                    conn.commit()
+                    # Log the reset
+                    c.execute("""
+                        INSERT INTO onboarding_log (phone, step, response, timestamp)
+                        VALUES (%s, 998, %s, CURRENT_TIMESTAMP)
+                    """, (phone, f"RESET: Usage quota and history reset by admin"))
+                    
+                    invalidate_history(phone)
                     
                     if usage_reset > 0:
                         actions_taken.append(f"Reset monthly usage quota")
@@ -1741,14 +2466,6 @@ def admin_reset_user():
                         actions_taken.append(f"Cleared {messages_cleared} message history")
                     if analytics_cleared > 0:
                         actions_taken.append(f"Cleared {analytics_cleared} analytics records")
-                    
-                    # Log the reset
-                    c.execute("""
-                        INSERT INTO onboarding_log (phone, step, response, timestamp)
-                        VALUES (%s, 998, %s, CURRENT_TIMESTAMP)
-                    """, (phone, f"RESET: Usage quota and history reset by admin"))
-                    
-                    conn.commit()
                     actions_taken.append("Logged user reset")
                     
         except Exception as db_error:
@@ -1799,49 +2516,44 @@ def admin_check_user():
         
         user_info = {}
         
-        # Check if in whitelist
-        whitelist = load_whitelist()
-        user_info['in_whitelist'] = phone in whitelist
-        
-        # Get user profile
-        profile = get_user_profile(phone)
+        # Whitelist membership and profile in one indexed lookup, rather than
+        # fetching the whole whitelist to test a single number
+        in_whitelist, profile = get_sender_access(phone)
+        user_info['in_whitelist'] = in_whitelist
         user_info['profile'] = profile
         
-        # Get recent messages
+        # Get recent messages, SMS delivery logs and subscription events.
+        # The three queries are independent, so pipeline them into one round trip.
         try:
             with get_db_connection() as conn:
-                with conn.cursor() as c:
-                    c.execute("""
+                with conn.pipeline():
+                    messages_cur = conn.execute("""
                         SELECT role, content, intent_type, ts
                         FROM messages
                         WHERE phone = %s
                         ORDER BY id DESC
                         LIMIT 5
                     """, (phone,))
-                    messages = c.fetchall()
-                    user_info['recent_messages'] = [dict(msg) for msg in messages]
                     
-                    # Get recent SMS delivery logs
-                    c.execute("""
+                    sms_logs_cur = conn.execute("""
                         SELECT message_content, delivery_status, message_id, timestamp
                         FROM sms_delivery_log
                         WHERE phone = %s
                         ORDER BY id DESC
                         LIMIT 3
                     """, (phone,))
-                    sms_logs = c.fetchall()
-                    user_info['recent_sms_delivery'] = [dict(log) for log in sms_logs]
                     
-                    # Get subscription events
-                    c.execute("""
+                    events_cur = conn.execute("""
                         SELECT event_type, status, timestamp
                         FROM subscription_events
                         WHERE phone = %s
                         ORDER BY id DESC
                         LIMIT 3
                     """, (phone,))
-                    events = c.fetchall()
-                    user_info['subscription_events'] = [dict(event) for event in events]
+                
+                user_info['recent_messages'] = [dict(msg) for msg in messages_cur.fetchall()]
+                user_info['recent_sms_delivery'] = [dict(log) for log in sms_logs_cur.fetchall()]
+                user_info['subscription_events'] = [dict(event) for event in events_cur.fetchall()]
                     
         except Exception as db_error:
             logger.error(f"Database error checking user: {db_error}")
@@ -1886,26 +2598,34 @@ def admin_restore_user():
         # Create/update user profile
         try:
             with get_db_connection() as conn:
-                with conn.cursor() as c:
-                    
-                    c.execute("DELETE FROM user_profiles WHERE phone = %s", (phone,))
+                with conn.transaction(), conn.cursor() as c:
                     
+                    # Upsert replaces the old delete-then-insert: an existing row is
+                    # updated in place and keeps its original created_date
                     c.execute("""
                         INSERT INTO user_profiles 
                         (phone, first_name, location, onboarding_step, onboarding_completed, 
                          stripe_customer_id, subscription_status, created_date, updated_date)
                         VALUES (%s, %s, %s, 3, TRUE, %s, %s, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                        ON CONFLICT (phone) DO UPDATE
+                        SET first_name = EXCLUDED.first_name,
+                            location = EXCLUDED.location,
+                            onboarding_step = EXCLUDED.onboarding_step,
+                            onboarding_completed = EXCLUDED.onboarding_completed,
+                            stripe_customer_id = EXCLUDED.stripe_customer_id,
+                            subscription_status = EXCLUDED.subscription_status,
+                            subscription_id = NULL,
+                            updated_date = EXCLUDED.updated_date
                     """, (phone, first_name, location, stripe_customer_id, subscription_status))
                     
-                    conn.commit()
-                    actions_taken.append("Created complete user profile")
-                    
                     c.execute("""
                         INSERT INTO onboarding_log (phone, step, response, timestamp)
                         VALUES (%s, 999, %s, CURRENT_TIMESTAMP)
                     """, (phone, f"RESTORED: {first_name} in {location}"))
                     
-                    conn.commit()
+                    invalidate_user_profile(phone)
+                    clear_onboarding_state(phone)
+                    actions_taken.append("Created complete user profile")
                     actions_taken.append("Logged profile restoration")
                     
         except Exception as db_error:
@@ -1945,7 +2665,98 @@ def admin_restore_user():
         logger.error(f"Error restoring user: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/admin/broadcast', methods=['POST'])
+def admin_broadcast():
+    """Admin endpoint to send one message to every whitelisted user (or a given list)"""
+    api_key = request.headers.get('X-API-Key', '')
+    if not BROADCAST_API_KEY_BYTES or not hmac.compare_digest(api_key.encode(), BROADCAST_API_KEY_BYTES):
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    try:
+        data = request.get_json()
+        message = (data.get('message') or '').strip()
+        
+        if not message:
+            return jsonify({"error": "Message required"}), 400
+        
+        phones = data.get('phones')
+        if phones:
+            recipients = sorted({normalize_phone_number(phone) for phone in phones if phone})
+        else:
+            recipients = sorted(load_whitelist())
+        
+        result = send_sms_bulk(recipients, message)
+        
+        if "error" in result:
+            return jsonify(result), 500
+        
+        logger.info(f"📢 Broadcast sent to {result['queued']} users")
+        
+        return jsonify({
+            "success": True,
+            "message": f"Broadcast queued for {result['queued']} of {result['recipients']} users",
+            **result
+        })
+        
+    except Exception as e:
+        logger.error(f"Error sending broadcast: {e}")
+        return jsonify({"error": str(e)}), 500
+
 # === STRIPE WEBHOOK ===
+# Stripe expects a 2xx within seconds and retries otherwise; the handlers' DB
+# writes and welcome/goodbye SMS run on a small pool once the event is verified
+STRIPE_WEBHOOK_WORKERS = 4
+# Waits between attempts at a failed event: Stripe already has its 200 and won't redeliver it
+STRIPE_EVENT_RETRY_DELAYS = (5, 30)
+
+def _start_stripe_executor():
+    global stripe_executor
+    stripe_executor = ThreadPoolExecutor(max_workers=STRIPE_WEBHOOK_WORKERS,
+                                         thread_name_prefix="stripe-webhook")
+
+_start_stripe_executor()
+# A forked worker can't use the parent's pool threads; give each its own
+os.register_at_fork(after_in_child=_start_stripe_executor)
+
+def process_stripe_event(event):
+    """Run the handler for a verified Stripe event (on the webhook pool), retrying
+    failures. If every attempt fails the claim is released, so a redelivery
+    (e.g. resending it from the Stripe dashboard) is processed instead of skipped."""
+    for attempt, delay in enumerate((*STRIPE_EVENT_RETRY_DELAYS, None), start=1):
+        try:
+            dispatch_stripe_event(event)
+            return
+        except Exception as e:
+            logger.error(f"💥 Error processing Stripe event {event['id']} (attempt {attempt}): {e}")
+            if delay is not None:
+                time.sleep(delay)
+    
+    release_stripe_event(event['id'])
+    logger.error(f"🚨 Stripe event {event['id']} ({event['type']}) failed; resend it from Stripe to retry")
+
+def dispatch_stripe_event(event):
+    """Route a verified Stripe event to its handler; handler failures propagate"""
+    if event['type'] == 'customer.subscription.created':
+        handle_subscription_created(event['data']['object'])
+    
+    elif event['type'] == 'customer.subscription.deleted':
+        handle_subscription_deleted(event['data']['object'])
+    
+    elif event['type'] == 'customer.subscription.updated':
+        subscription = event['data']['object']
+        logger.info(f"📝 Subscription updated: {subscription['id']} - Status: {subscription['status']}")
+    
+    elif event['type'] == 'invoice.payment_failed':
+        invoice = event['data']['object']
+        logger.warning(f"💳 Payment failed for customer: {invoice['customer']}")
+    
+    elif event['type'] == 'invoice.payment_succeeded':
+        invoice = event['data']['object']
+        logger.info(f"✅ Payment succeeded for customer: {invoice['customer']}")
+    
+    else:
+        logger.info(f"ℹ️ Unhandled Stripe event type: {event['type']}")
+
 @app.route('/webhook/stripe', methods=['POST'])
 def stripe_webhook():
     """Handle Stripe webhook events"""
@@ -1956,6 +2767,7 @@ def stripe_webhook():
         logger.error("Missing Stripe signature header")
         return jsonify({'error': 'Missing signature header'}), 400
     
+    claimed_event_id = None
     try:
         event = stripe.Webhook.construct_event(
             payload, sig_header, STRIPE_WEBHOOK_SECRET
@@ -1963,26 +2775,13 @@ def stripe_webhook():
         
         logger.info(f"📨 Received Stripe webhook: {event['type']}")
         
-        if event['type'] == 'customer.subscription.created':
-            handle_subscription_created(event['data']['object'])
-        
-        elif event['type'] == 'customer.subscription.deleted':
-            handle_subscription_deleted(event['data']['object'])
-        
-        elif event['type'] == 'customer.subscription.updated':
-            subscription = event['data']['object']
-            logger.info(f"📝 Subscription updated: {subscription['id']} - Status: {subscription['status']}")
-        
-        elif event['type'] == 'invoice.payment_failed':
-            invoice = event['data']['object']
-            logger.warning(f"💳 Payment failed for customer: {invoice['customer']}")
+        # Stripe redelivers events; only the first delivery is processed
+        if not claim_stripe_event(event['id'], event['type']):
+            logger.info(f"🔁 Skipping redelivered Stripe event {event['id']}")
+            return jsonify({'status': 'duplicate'}), 200
+        claimed_event_id = event['id']
         
-        elif event['type'] == 'invoice.payment_succeeded':
-            invoice = event['data']['object']
-            logger.info(f"✅ Payment succeeded for customer: {invoice['customer']}")
-        
-        else:
-            logger.info(f"ℹ️ Unhandled Stripe event type: {event['type']}")
+        stripe_executor.submit(process_stripe_event, event)
         
         return jsonify({'status': 'success'}), 200
         
@@ -1994,110 +2793,183 @@ def stripe_webhook():
         return jsonify({'error': 'Invalid signature'}), 400
     except Exception as e:
         logger.error(f"💥 Error processing Stripe webhook: {e}")
+        if claimed_event_id:
+            release_stripe_event(claimed_event_id)
         return jsonify({'error': 'Webhook processing failed'}), 500
 
+# === Precomputed Webhook Responses ===
+def precomputed_json(payload, status):
+    """Serialize a constant JSON reply once instead of on every request"""
+    return json.dumps(payload, separators=(',', ':')).encode() + b"\n", status
+
+def json_reply(precomputed):
+    """Wrap a precomputed (body, status) pair in a fresh Response"""
+    body, status = precomputed
+    return Response(body, status=status, mimetype='application/json')
+
+RESP_MISSING_FROM = precomputed_json({"error": "Missing 'from' field"}, 400)
+RESP_EMPTY_MESSAGE = precomputed_json({"message": "Empty message received"}, 200)
+RESP_UNAUTHORIZED = precomputed_json({"message": "Unauthorized sender"}, 403)
+RESP_CONTENT_FILTERED = precomputed_json({"message": "Content filtered"}, 400)
+RESP_UNSUBSCRIBED = precomputed_json({"message": "Unsubscribe processed"}, 200)
+RESP_UNSUBSCRIBE_FAILED = precomputed_json({"error": "Failed to process unsubscribe"}, 500)
+RESP_START_SENT = precomputed_json({"message": "Start message sent"}, 200)
+RESP_START_FAILED = precomputed_json({"error": "Failed to send start message"}, 500)
+RESP_ONBOARDING_STARTED = precomputed_json({"message": "Onboarding started for new user"}, 200)
+RESP_ONBOARDING_START_FAILED = precomputed_json({"error": "Failed to start onboarding"}, 500)
+RESP_ONBOARDING_SENT = precomputed_json({"message": "Onboarding response sent"}, 200)
+RESP_ONBOARDING_SEND_FAILED = precomputed_json({"error": "Failed to send onboarding response"}, 500)
+RESP_ONBOARDING_FALLBACK = precomputed_json({"message": "Onboarding fallback sent"}, 200)
+RESP_ONBOARDING_FAILED = precomputed_json({"error": "Onboarding failed"}, 500)
+RESP_OK = precomputed_json({"message": "Response sent successfully"}, 200)
+RESP_SEND_FAILED = precomputed_json({"error": "Failed to send response"}, 500)
+RESP_FALLBACK = precomputed_json({"message": "Fallback response sent"}, 200)
+RESP_PROCESSING_FAILED = precomputed_json({"error": "Processing failed"}, 500)
+
+def reply_with_sms(sender, message, sent_reply, failed_reply, failure_log, intent_type=None):
+    """Send a fixed SMS outside the quota and answer the webhook with sent_reply,
+    or log and answer with failed_reply if sending raises. With intent_type the
+    SMS is also saved to the conversation history."""
+    try:
+        send_sms(sender, message, bypass_quota=True)
+        if intent_type:
+            save_message(sender, "assistant", message, intent_type, 0)
+        return json_reply(sent_reply)
+    except Exception as e:
+        logger.error(f"{failure_log}: {e}")
+        return json_reply(failed_reply)
+
+def reply_to_onboarding(sender, body, step):
+    """Answer a message from a user who hasn't finished onboarding"""
+    logger.info(f"🚀 User {sender} is in onboarding process (step {step})")
+    
+    try:
+        response_msg = handle_onboarding_response(sender, body)
+        result = send_sms(sender, response_msg)
+        
+        if "error" not in result:
+            logger.info(f"✅ Onboarding response sent to {sender}")
+            return json_reply(RESP_ONBOARDING_SENT)
+        else:
+            logger.error(f"❌ Failed to send onboarding response to {sender}: {result['error']}")
+            return json_reply(RESP_ONBOARDING_SEND_FAILED)
+            
+    except Exception as e:
+        logger.error(f"💥 Onboarding error for {sender}: {e}")
+        return reply_with_sms(sender, "Sorry, there was an error during setup. Please try again.",
+                              RESP_ONBOARDING_FALLBACK, RESP_ONBOARDING_FAILED,
+                              "Failed to send onboarding fallback")
+
+# === Sports Replies ===
+# Entities carry the sport detected by detect_sports_intent (NFL when unclear)
+def answer_sports_schedule(entities):
+    sport_type = entities.get("sport", "nfl")
+    team_name = entities.get("team")
+    if not team_name:
+        return f"Which {sport_type.upper()} team are you asking about?"
+    team_data = get_team_data(team_name, sport_type)
+    if not team_data:
+        return f"Team '{team_name}' not found. Try: Saints, Patriots, Cowboys, etc."
+    return get_sports_schedule(sport_type, team_data['id'], team_data['name'])
+
+def answer_sports_scores(entities):
+    return get_sports_scores(entities.get("sport", "nfl"))
+
+def answer_sports_team(entities):
+    sport_type = entities.get("sport", "nfl")
+    team_name = entities.get("team")
+    if not team_name:
+        return get_sports_scores(sport_type)
+    team_data = get_team_data(team_name, sport_type)
+    if not team_data:
+        return f"Team '{team_name}' not found."
+    return get_sports_schedule(sport_type, team_data['id'], team_data['name'])
+
+# One lookup per message instead of a chain of type comparisons
+SPORTS_HANDLERS = MappingProxyType({
+    "sports_schedule": answer_sports_schedule,
+    "sports_scores": answer_sports_scores,
+    "sports_team_score": answer_sports_team,
+    "sports_team_info": answer_sports_team,
+})
+
 # === MAIN SMS WEBHOOK ===
+STOP_COMMANDS = frozenset(['stop', 'quit', 'unsubscribe'])
+START_COMMANDS = frozenset(['start', 'subscribe', 'resume'])
+
 @app.route("/sms", methods=["POST"])
 @handle_errors  
 def sms_webhook():
-    start_time = time.time()
+    start_ns = time.perf_counter_ns()
     
-    sender = request.form.get("from")
+    # Normalized once here; every helper below receives the canonical +1XXXXXXXXXX form
+    sender = normalize_phone_number(request.form.get("from"))
     body = (request.form.get("body") or "").strip()
     
-    logger.info(f"📱 SMS received from {sender}: {repr(body)}")
+    logger.info("📱 SMS received from %s: %r", sender, body)
     
     if not sender:
-        return jsonify({"error": "Missing 'from' field"}), 400
+        return json_reply(RESP_MISSING_FROM)
     
     if not body:
-        return jsonify({"message": "Empty message received"}), 200
+        return json_reply(RESP_EMPTY_MESSAGE)
+    body_lower = body.lower()
     
-    # Check whitelist
-    whitelist = load_whitelist()
-    if sender not in whitelist:
+    # Check whitelist (also primes the profile cache for the lookups below)
+    whitelisted, _ = get_sender_access(sender)
+    if not whitelisted:
         logger.warning(f"🚫 Unauthorized sender: {sender}")
-        return jsonify({"message": "Unauthorized sender"}), 403
+        return json_reply(RESP_UNAUTHORIZED)
     
     # Content filtering
     is_valid, filter_reason = content_filter.is_valid_query(body)
     if not is_valid:
         logger.warning(f"🚫 Content filtered for {sender}: {filter_reason}")
-        return jsonify({"message": "Content filtered"}), 400
+        return json_reply(RESP_CONTENT_FILTERED)
     
     # Save user message
     save_message(sender, "user", body)
     
     # Handle special commands
-    if body.lower() in ['stop', 'quit', 'unsubscribe']:
-        response_msg = "You've been unsubscribed from Hey Alex at +18338613041. Text START to resume service."
-        try:
-            send_sms(sender, response_msg, bypass_quota=True)
-            return jsonify({"message": "Unsubscribe processed"}), 200
-        except Exception as e:
-            logger.error(f"Failed to send unsubscribe message: {e}")
-            return jsonify({"error": "Failed to process unsubscribe"}), 500
+    if body_lower in STOP_COMMANDS:
+        return reply_with_sms(sender, "You've been unsubscribed from Hey Alex at +18338613041. Text START to resume service.",
+                              RESP_UNSUBSCRIBED, RESP_UNSUBSCRIBE_FAILED,
+                              "Failed to send unsubscribe message")
     
-    if body.lower() in ['start', 'subscribe', 'resume']:
+    if body_lower in START_COMMANDS:
         if is_user_onboarded(sender):
             response_msg = WELCOME_MSG
         else:
             create_user_profile(sender)
             response_msg = ONBOARDING_NAME_MSG
         
-        try:
-            send_sms(sender, response_msg, bypass_quota=True)
-            save_message(sender, "assistant", response_msg, "start_command", 0)
-            return jsonify({"message": "Start message sent"}), 200
-        except Exception as e:
-            logger.error(f"Failed to send start message: {e}")
-            return jsonify({"error": "Failed to send start message"}), 500
+        return reply_with_sms(sender, response_msg, RESP_START_SENT, RESP_START_FAILED,
+                              "Failed to send start message", intent_type="start_command")
+    
+    # Users mid-onboarding are answered straight from the onboarding state
+    onboarding = get_onboarding_state(sender)
+    if onboarding:
+        return reply_to_onboarding(sender, body, onboarding['step'])
     
     # Check if user needs to complete onboarding
     profile = get_user_profile(sender)
-    logger.info(f"👤 User profile for {sender}: {profile}")
+    logger.debug("👤 User profile for %s: %s", sender, profile)
     
     if not profile:
         logger.info(f"📝 No profile found for {sender}, creating new profile")
         create_user_profile(sender)
         
-        try:
-            send_sms(sender, ONBOARDING_NAME_MSG, bypass_quota=True)
-            save_message(sender, "assistant", ONBOARDING_NAME_MSG, "onboarding_start", 0)
-            return jsonify({"message": "Onboarding started for new user"}), 200
-        except Exception as e:
-            logger.error(f"Failed to send onboarding start message: {e}")
-            return jsonify({"error": "Failed to start onboarding"}), 500
+        return reply_with_sms(sender, ONBOARDING_NAME_MSG, RESP_ONBOARDING_STARTED, RESP_ONBOARDING_START_FAILED,
+                              "Failed to send onboarding start message", intent_type="onboarding_start")
     
     elif not profile['onboarding_completed']:
-        logger.info(f"🚀 User {sender} is in onboarding process (step {profile['onboarding_step']})")
-        
-        try:
-            response_msg = handle_onboarding_response(sender, body)
-            result = send_sms(sender, response_msg)
-            
-            if "error" not in result:
-                logger.info(f"✅ Onboarding response sent to {sender}")
-                return jsonify({"message": "Onboarding response sent"}), 200
-            else:
-                logger.error(f"❌ Failed to send onboarding response to {sender}: {result['error']}")
-                return jsonify({"error": "Failed to send onboarding response"}), 500
-                
-        except Exception as e:
-            logger.error(f"💥 Onboarding error for {sender}: {e}")
-            fallback_msg = "Sorry, there was an error during setup. Please try again."
-            try:
-                send_sms(sender, fallback_msg, bypass_quota=True)
-                return jsonify({"message": "Onboarding fallback sent"}), 200
-            except Exception as fallback_error:
-                logger.error(f"Failed to send onboarding fallback: {fallback_error}")
-                return jsonify({"error": "Onboarding failed"}), 500
+        return reply_to_onboarding(sender, body, profile['onboarding_step'])
     
     # Check if user is requesting a longer response
     is_longer_request = detect_longer_request(body)
     
     # User is fully onboarded - continue to normal processing
-    logger.info(f"✅ User {sender} is fully onboarded: {profile['first_name']} in {profile['location']}")
+    logger.debug("✅ User %s is fully onboarded: %s in %s", sender, profile['first_name'], profile['location'])
     
     intent = detect_intent(body, sender)
     intent_type = intent.type if intent else "general"
@@ -2105,90 +2977,58 @@ def sms_webhook():
     # Add longer request flag to intent type for logging
     if is_longer_request:
         intent_type += "_longer"
-        logger.info(f"🔍 User requested longer response for: {body}")
+        logger.debug("🔍 User requested longer response for: %s", body)
     
-    user_context = get_user_context_for_queries(sender)
+    user_context = get_user_context_for_queries(sender, profile)
     
     try:
         # Handle sports queries with ESPN API
-        if intent and intent.type.startswith("sports"):
-            sport_type = intent.entities.get("sport", "nfl")  # Default to NFL
-            
-            if intent.type == "sports_schedule":
-                team_name = intent.entities.get("team")
-                if team_name:
-                    team_data = get_team_data(team_name, sport_type)
-                    if team_data:
-                        response_msg = get_sports_schedule(sport_type, team_data['id'], team_data['name'])
-                    else:
-                        response_msg = f"Team '{team_name}' not found. Try: Saints, Patriots, Cowboys, etc."
-                else:
-                    response_msg = f"Which {sport_type.upper()} team are you asking about?"
-            
-            elif intent.type == "sports_scores":
-                response_msg = get_sports_scores(sport_type)
-            
-            elif intent.type == "sports_team_score" or intent.type == "sports_team_info":
-                team_name = intent.entities.get("team")
-                if team_name:
-                    team_data = get_team_data(team_name, sport_type)
-                    if team_data:
-                        response_msg = get_sports_schedule(sport_type, team_data['id'], team_data['name'])
-                    else:
-                        response_msg = f"Team '{team_name}' not found."
-                else:
-                    response_msg = get_sports_scores(sport_type)
+        sports_handler = SPORTS_HANDLERS.get(intent.type) if intent else None
+        if sports_handler:
+            response_msg = sports_handler(intent.entities)
         
         # Handle other queries
         else:
-            if user_context['personalized']:
-                personalized_msg = f"User's name is {user_context['first_name']} and they live in {user_context['location']}. " + body
-                response_msg = ask_claude(sender, personalized_msg)
-            else:
-                response_msg = ask_claude(sender, body)
-            
-            if "Let me search for" in response_msg:
-                search_term = body
-                if user_context['personalized'] and not any(keyword in body.lower() for keyword in ['in ', 'near ', 'at ']):
-                    search_term += f" in {user_context['location']}"
-                response_msg = web_search(search_term, search_type="general")
+            system = user_context.get('system_prompt')
+            # ask_claude already routes "let me search for ..." replies to web_search
+            response_msg = ask_claude(sender, body, system=system)
         
+        # The one place replies are fitted to the SMS limit (send_sms only
+        # guards ClickSend's hard cap)
         original_length = len(response_msg)
         response_msg = truncate_response(response_msg, MAX_SMS_LENGTH)
         message_parts = 3  # All messages are now 3 SMS parts (480 chars)
         
         if original_length > len(response_msg):
-            logger.info(f"📏 Response truncated from {original_length} to {len(response_msg)} chars")
+            logger.debug("📏 Response truncated from %d to %d chars", original_length, len(response_msg))
         
         # Log message parts for cost tracking
-        logger.info(f"📊 Response will use {message_parts} message parts")
+        logger.debug("📊 Response will use %d message parts", message_parts)
         
-        response_time = int((time.time() - start_time) * 1000)
-        save_message(sender, "assistant", response_msg, intent_type, response_time)
+        response_time = (time.perf_counter_ns() - start_ns) // 1_000_000
         
+        # Saved reply, delivery log and analytics are queued for the background writer
+        save_message(sender, "assistant", response_msg, intent_type, response_time)
         result = send_sms(sender, response_msg)
+        sent = "error" not in result
+        log_usage_analytics(sender, intent_type, sent, response_time)
         
-        if "error" not in result:
-            log_usage_analytics(sender, intent_type, True, response_time)
-            logger.info(f"✅ Response sent to {sender} in {response_time}ms (length: {len(response_msg)} chars, {message_parts} parts)")
-            return jsonify({"message": "Response sent successfully"}), 200
+        if sent:
+            logger.info("✅ Response sent to %s in %dms (length: %d chars, %d parts)",
+                        sender, response_time, len(response_msg), message_parts)
+            return json_reply(RESP_OK)
         else:
-            log_usage_analytics(sender, intent_type, False, response_time)
             logger.error(f"❌ Failed to send response to {sender}: {result['error']}")
-            return jsonify({"error": "Failed to send response"}), 500
+            return json_reply(RESP_SEND_FAILED)
             
     except Exception as e:
-        response_time = int((time.time() - start_time) * 1000)
+        response_time = (time.perf_counter_ns() - start_ns) // 1_000_000
         log_usage_analytics(sender, intent_type, False, response_time)
         logger.error(f"💥 Processing error for {sender}: {e}")
         
-        fallback_msg = "Sorry, I'm having trouble processing your request. Please try again in a moment."
-        try:
-            send_sms(sender, fallback_msg, bypass_quota=True)
-            return jsonify({"message": "Fallback response sent"}), 200
-        except Exception as fallback_error:
-            logger.error(f"Failed to send fallback message: {fallback_error}")
-            return jsonify({"error": "Processing failed"}), 500
+        return reply_with_sms(sender, "Sorry, I'm having trouble processing your request. Please try again in a moment.",
+                              RESP_FALLBACK, RESP_PROCESSING_FAILED,
+                              "Failed to send fallback message")
 
 # === HEALTH CHECK ===
 @app.route('/')
@@ -2196,7 +3036,7 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'version': APP_VERSION,
-        'latest_changes': CHANGELOG[APP_VERSION],
+        'latest_changes': LATEST_CHANGES,
         'database_type': 'PostgreSQL',
         'sms_number': '+18338613041',
         'sms_char_limit': MAX_SMS_LENGTH,
@@ -2209,7 +3049,8 @@ def health_check():
             '/admin/remove-user',
             '/admin/reset-user', 
             '/admin/restore-user',
-            '/admin/check-user'
+            '/admin/check-user',
+            '/admin/broadcast'
         ],
         'contact_info': {
             'sms': '+18338613041',
@@ -2217,16 +3058,35 @@ def health_check():
         }
     })
 
-# Initialize database on startup
-init_db()
+# Initialize database once per process, on the first request rather than at import
+_db_initialized = False
+_db_init_lock = threading.Lock()
+
+def ensure_db_initialized():
+    global _db_initialized
+    if _db_initialized:
+        return
+    with _db_init_lock:
+        if not _db_initialized:
+            init_db()
+            _db_initialized = True
+
+@app.before_request
+def init_db_before_request():
+    ensure_db_initialized()
 
 if __name__ == "__main__":
-    logger.info(f"🚀 Starting Hey Alex SMS Assistant v{APP_VERSION}")
-    logger.info(f"📋 Latest changes: {CHANGELOG[APP_VERSION]}")
-    logger.info(f"🗄️ Database: PostgreSQL (persistent storage)")
-    logger.info(f"📏 SMS response limit: {MAX_SMS_LENGTH} characters (3 SMS parts)")
-    logger.info(f"📊 Monthly message limit: {MONTHLY_LIMIT} detailed messages")
-    logger.info(f"🏈 Sports API: ESPN integration enabled (NFL, MLB, NHL, College)")
-    logger.info(f"🔧 Admin endpoints available: /admin/remove-user, /admin/reset-user, /admin/restore-user, /admin/check-user")
-    logger.info(f"📱 SMS Number: +18338613041")
+    # Start listening right away; the first request waits on the init lock if
+    # this hasn't finished, and retries it if it failed
+    threading.Thread(target=ensure_db_initialized, name="db-init", daemon=True).start()
+    logger.info(
+        f"🚀 Starting Hey Alex SMS Assistant v{APP_VERSION}\n"
+        f"📋 Latest changes: {LATEST_CHANGES}\n"
+        f"🗄️ Database: PostgreSQL (persistent storage)\n"
+        f"📏 SMS response limit: {MAX_SMS_LENGTH} characters (3 SMS parts)\n"
+        f"📊 Monthly message limit: {MONTHLY_LIMIT} detailed messages\n"
+        f"🏈 Sports API: ESPN integration enabled (NFL, MLB, NHL, College)\n"
+        f"🔧 Admin endpoints available: /admin/remove-user, /admin/reset-user, /admin/restore-user, /admin/check-user, /admin/broadcast\n"
+        f"📱 SMS Number: +18338613041"
+    )
     app.run(debug=True, host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))